@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Batch label rendering across CPU cores.
+
+Rows of formdata are rendered with generate_png in a pool of worker
+processes, so a season's worth of tags isn't rendered one at a time on a
+single request thread. Each worker keeps its own template, font, base image
+and layer caches between rows and between batches.
+
+Workers are spawned (as they have to be on Windows), and a spawned process
+re-imports the parent's main module. A main script that shouldn't run again
+in every worker, like printform-server.py, declares
+``__spec__ = importlib.util.find_spec('batch_render')`` so workers start
+from this module instead.
+
+```python
+from batch_render import BatchRenderer
+renderer = BatchRenderer()
+results = renderer.render(template_path, [{"main_text": "Acer palmatum"}])
+zip_bytes, manifest = renderer.render_zip(template_path, rows)
+```
+"""
+
+import io
+import os
+import re
+import json
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple, Optional, Any
+from PIL import Image
+
+from label_renderer import TemplateRegistry, generate_png, LABEL_SIZE_INCHES
+from render_cache import render_key
+
+# Compiled templates for the worker process this module is loaded in
+_worker_registry = None
+
+# Every page of a PDF is decoded and held until the file is written
+# (about 1.4 MB per label), so PDF batches are capped; ZIPs aren't
+MAX_PDF_PAGES = 250
+
+
+class BatchTooLarge(ValueError):
+    """Raised when a batch has more rows than its output format allows."""
+
+
+def _sanitize_string(s):
+    """Removes special characters and replaces spaces with dashes."""
+    return re.sub(r'[^a-zA-Z0-9\s]', '', s).replace(' ', '-').lower()
+
+
+def row_filename(index: int, formdata: Dict[str, str]) -> str:
+    """
+    Build the file name for a rendered row, e.g. "0003_acer-palmatum_bloodgood.png".
+    """
+    parts = [
+        _sanitize_string(formdata.get(name, ''))
+        for name in ("main_text", "midtext", "subtext")
+    ]
+    name = '_'.join(part for part in parts if part) or 'label'
+    return f"{index:04d}_{name}.png"
+
+
+def _render_row(template_path: str, formdata: Dict[str, str],
+                offset_adjustment: Tuple[int, int],
+                default_alignment: Tuple[int, int]) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Render one row in a worker process and encode it as PNG.
+
+    Returns:
+        (png_bytes, None) on success or (None, error message) on failure
+    """
+    global _worker_registry
+    try:
+        if _worker_registry is None:
+            _worker_registry = TemplateRegistry()
+        plan = _worker_registry.get_plan_for_path(template_path)
+        img = generate_png(plan, formdata, offset_adjustment, default_alignment)
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue(), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+class BatchRenderer:
+    """
+    Renders many labels in parallel using a persistent process pool.
+
+    The pool is started on first use and kept for later batches, so worker
+    start-up and cache warm-up are only paid once. If a RenderCache is given,
+    rows rendered before are taken from it and only the rest are sent to the
+    workers.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, cache=None,
+                 max_pdf_pages: int = MAX_PDF_PAGES):
+        """
+        Initialize the BatchRenderer.
+
+        Args:
+            max_workers: Number of worker processes (default: CPU count)
+            cache: Optional RenderCache shared with the rest of the server
+            max_pdf_pages: Most rows render_pdf() accepts
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache = cache
+        self.max_pdf_pages = max_pdf_pages
+        self._lock = threading.Lock()
+        self._executor = None
+        self._registry = TemplateRegistry()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Return the process pool, starting it if needed."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _reset_executor(self):
+        """Drop a broken process pool so the next batch starts a fresh one."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def render(self, template_path: str, rows: List[Dict[str, str]],
+               offset_adjustment: Tuple[int, int] = (0, 0),
+               default_alignment: Tuple[int, int] = (0, 0)) -> List[Dict[str, Any]]:
+        """
+        Render every row with the given template.
+
+        Args:
+            template_path: Path to the label_template*.json file
+            rows: List of formdata dictionaries
+            offset_adjustment: (x, y) offset applied to every row
+            default_alignment: (x, y) default alignment applied to every row
+
+        Returns:
+            One result per row, in order, each with "index", "filename",
+            "png" (bytes or None) and "error" (message or None)
+        """
+        offset_adjustment = tuple(offset_adjustment)
+        default_alignment = tuple(default_alignment)
+
+        # Look up rows that were rendered before; only submit the rest
+        keys = [None] * len(rows)
+        cached = [None] * len(rows)
+        plan = None
+        if self.cache is not None:
+            try:
+                plan = self._registry.get_plan_for_path(template_path)
+            except (OSError, ValueError, KeyError):
+                pass  # The workers will report the error for each row
+        if plan is not None:
+            for index, formdata in enumerate(rows):
+                keys[index] = render_key(plan, formdata, offset_adjustment, default_alignment)
+                cached[index] = self.cache.get(keys[index])
+
+        executor = None
+        futures = []
+        for index, formdata in enumerate(rows):
+            if cached[index] is not None:
+                futures.append(None)
+                continue
+            if executor is None:
+                executor = self._get_executor()
+            futures.append(executor.submit(_render_row, template_path, formdata,
+                                           offset_adjustment, default_alignment))
+
+        results = []
+        for index, (formdata, future) in enumerate(zip(rows, futures)):
+            if future is None:
+                png, error = cached[index], None
+            else:
+                try:
+                    png, error = future.result()
+                except BrokenProcessPool as e:
+                    self._reset_executor()
+                    png, error = None, f"Render worker crashed: {e}"
+                except Exception as e:
+                    png, error = None, f"{type(e).__name__}: {e}"
+
+                if png is not None and keys[index] is not None:
+                    self.cache.put(keys[index], png, persist=True)
+
+            results.append({
+                "index": index,
+                "filename": row_filename(index, formdata),
+                "png": png,
+                "error": error,
+            })
+        return results
+
+    @staticmethod
+    def _manifest(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Per-row status without the image data."""
+        return [
+            {
+                "index": result["index"],
+                "filename": result["filename"] if result["png"] is not None else None,
+                "error": result["error"],
+            }
+            for result in results
+        ]
+
+    def render_zip(self, template_path: str, rows: List[Dict[str, str]],
+                   offset_adjustment: Tuple[int, int] = (0, 0),
+                   default_alignment: Tuple[int, int] = (0, 0)) -> Tuple[bytes, List[Dict[str, Any]]]:
+        """
+        Render every row and pack the PNGs into a ZIP archive. The archive
+        also holds manifest.json with each row's file name or error.
+
+        Returns:
+            (zip_bytes, manifest)
+        """
+        results = self.render(template_path, rows, offset_adjustment, default_alignment)
+        manifest = self._manifest(results)
+
+        buffer = io.BytesIO()
+        # PNGs are already compressed, so store them as-is
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for result in results:
+                if result["png"] is not None:
+                    archive.writestr(result["filename"], result["png"])
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+        return buffer.getvalue(), manifest
+
+    def render_pdf(self, template_path: str, rows: List[Dict[str, str]],
+                   offset_adjustment: Tuple[int, int] = (0, 0),
+                   default_alignment: Tuple[int, int] = (0, 0)) -> Tuple[Optional[bytes], List[Dict[str, Any]]]:
+        """
+        Render every row into a multi-page PDF, one label per page. Rows that
+        failed are left out and reported in the manifest.
+
+        Returns:
+            (pdf_bytes or None if no row rendered, manifest)
+
+        Raises:
+            BatchTooLarge: If there are more than max_pdf_pages rows
+        """
+        if len(rows) > self.max_pdf_pages:
+            raise BatchTooLarge(f"PDF batches are limited to {self.max_pdf_pages} labels "
+                                f"({len(rows)} given); split the batch or use the zip format")
+
+        results = self.render(template_path, rows, offset_adjustment, default_alignment)
+        manifest = self._manifest(results)
+
+        pages = [
+            Image.open(io.BytesIO(result["png"])).convert('RGB')
+            for result in results if result["png"] is not None
+        ]
+        if not pages:
+            return None, manifest
+
+        # Size the pages to the physical label
+        resolution = pages[0].width / LABEL_SIZE_INCHES[0]
+        buffer = io.BytesIO()
+        pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:],
+                      resolution=resolution)
+        return buffer.getvalue(), manifest
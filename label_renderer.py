@@ -0,0 +1,700 @@
+#!/usr/bin/env python3
+"""
+Label rendering for the PrintForm server.
+
+Templates in static/label-templates are compiled once into RenderPlan objects
+and kept in a process-wide TemplateRegistry. A plan is only rebuilt when its
+template file's mtime changes, so the preview loop does no directory listing
+or JSON parsing while staff are typing. Fonts are likewise loaded once per
+(font file, size) by the shared font_registry, and base images are decoded
+once by base_image_cache. Each field's text is rasterized into a layer held
+by layer_cache, so an edit to one field only redraws that field.
+
+```python
+from label_renderer import TemplateRegistry, generate_png
+registry = TemplateRegistry()
+plan = registry.get_plan("Default Label Template")
+img = generate_png(plan, formdata, (0, 0))
+```
+"""
+
+import os
+import io
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Optional, Any
+from PIL import Image, ImageDraw, ImageFont
+
+# Folder holding label_template*.json files
+TEMPLATE_FOLDER = "static/label-templates"
+
+# Base image used when a template doesn't name one
+DEFAULT_BASE_IMAGE = "static/label-templates/label_base.png"
+
+# Bundled fonts; a template's "font-base" is looked up here first
+FONT_FOLDER = "static/fonts"
+
+# Physical label size, and the resolution of the TEC B-SX5T label printer
+LABEL_SIZE_INCHES = (5, 1)
+DEVICE_DPI = (305, 305)
+
+
+def resolve_font_path(font_base: str, bold: bool = False, italic: bool = False) -> str:
+    """
+    Build the font file path for a font-base name and weight/style.
+
+    "arial.ttf" becomes "arialbd.ttf", "ariali.ttf" or "arialbi.ttf". If the
+    file exists in FONT_FOLDER that path is returned, otherwise the bare name
+    is returned so Pillow can fall back to the system font directory.
+    """
+    if bold and italic:
+        font_name = font_base.replace(".ttf", "bi.ttf")
+    elif bold:
+        font_name = font_base.replace(".ttf", "bd.ttf")
+    elif italic:
+        font_name = font_base.replace(".ttf", "i.ttf")
+    else:
+        font_name = font_base
+
+    bundled_path = os.path.join(FONT_FOLDER, font_name)
+    if os.path.exists(bundled_path):
+        return bundled_path
+    return font_name
+
+
+def font_family_paths(font_base: str) -> List[str]:
+    """
+    Get the resolved paths of every weight/style variant of a font-base name.
+    """
+    return [
+        resolve_font_path(font_base, bold, italic)
+        for bold, italic in ((False, False), (True, False), (False, True), (True, True))
+    ]
+
+
+class FontRegistry:
+    """
+    Process-wide cache of loaded fonts.
+
+    Each font file is read from disk once and kept in memory, and each
+    (font_path, size) pair is turned into an ImageFont only once. Hit and
+    miss counts are kept so the cache can be checked from /render_stats.
+    """
+
+    def __init__(self):
+        """Initialize an empty FontRegistry."""
+        self._lock = threading.Lock()
+        self._face_bytes = {}  # font_path -> raw font file bytes
+        self._fonts = {}       # (font_path, size) -> ImageFont.FreeTypeFont
+        self.hits = 0
+        self.misses = 0
+
+    def _load_face_bytes(self, font_path: str) -> Optional[bytes]:
+        """
+        Read a font file into memory, or return None for fonts that are not
+        a file on disk (bare names Pillow resolves from the system font folder).
+        """
+        if font_path not in self._face_bytes:
+            if not os.path.exists(font_path):
+                return None
+            with open(font_path, 'rb') as f:
+                self._face_bytes[font_path] = f.read()
+        return self._face_bytes[font_path]
+
+    def get_font(self, font_path: str, size: int):
+        """
+        Get the ImageFont for a resolved font path and size, loading it on
+        first use.
+
+        Args:
+            font_path: Resolved font path (see resolve_font_path)
+            size: Font size in pixels
+
+        Returns:
+            ImageFont.FreeTypeFont
+        """
+        key = (font_path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self.hits += 1
+                return font
+
+            self.misses += 1
+            face_bytes = self._load_face_bytes(font_path)
+            if face_bytes is None:
+                font = ImageFont.truetype(font_path, size)
+            else:
+                font = ImageFont.truetype(io.BytesIO(face_bytes), size)
+            self._fonts[key] = font
+            return font
+
+    def preload(self, plans) -> int:
+        """
+        Load every font the given plans use, plus the other weight/style
+        files of the same font families, so the first preview doesn't pay
+        for reading TrueType files.
+
+        Args:
+            plans: Iterable of RenderPlan objects
+
+        Returns:
+            Number of (font_path, size) pairs now loaded
+        """
+        for plan in plans:
+            for field in plan.fields:
+                with self._lock:
+                    for font_path in font_family_paths(field.style['font-base']):
+                        self._load_face_bytes(font_path)
+                if (field.font_path, field.font_size) not in self._fonts:
+                    self.get_font(field.font_path, field.font_size)
+        return len(self._fonts)
+
+    def clear(self):
+        """Forget every loaded font and reset the counters."""
+        with self._lock:
+            self._face_bytes.clear()
+            self._fonts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "faces_loaded": len(self._face_bytes),
+                "fonts_loaded": len(self._fonts),
+                "face_bytes": sum(len(b) for b in self._face_bytes.values()),
+            }
+
+
+# Shared by every render in this process
+font_registry = FontRegistry()
+
+
+class BaseImageCache:
+    """
+    Process-wide cache of decoded base label images.
+
+    Each base image is decoded once and kept in memory; renders draw on a
+    copy of it. The file's mtime is checked on every lookup so edits to a
+    base image are picked up without restarting the server.
+    """
+
+    def __init__(self):
+        """Initialize an empty BaseImageCache."""
+        self._lock = threading.Lock()
+        self._images = {}  # image_path -> (mtime, decoded Image)
+        self._device_images = {}  # (image_path, size) -> (source Image, 1-bit Image)
+        self.hits = 0
+        self.misses = 0
+
+    def _get_decoded(self, image_path: str):
+        """Return the cached decoded image, decoding it if missing or stale."""
+        mtime = os.path.getmtime(image_path)
+        with self._lock:
+            cached = self._images.get(image_path)
+            if cached is not None and cached[0] == mtime:
+                self.hits += 1
+                return cached[1]
+
+            self.misses += 1
+            with Image.open(image_path) as img:
+                img.load()
+                decoded = img.copy()
+            self._images[image_path] = (mtime, decoded)
+            return decoded
+
+    def get_copy(self, image_path: str):
+        """
+        Get a private, drawable copy of a base image.
+
+        Args:
+            image_path: Path to the base image file
+
+        Returns:
+            PIL Image the caller may modify freely
+        """
+        return self._get_decoded(image_path).copy()
+
+    def get_size(self, image_path: str) -> Tuple[int, int]:
+        """Get the (width, height) of a base image without copying it."""
+        return self._get_decoded(image_path).size
+
+    def get_device_copy(self, image_path: str, size: Tuple[int, int]):
+        """
+        Get a private, drawable 1-bit copy of a base image scaled to a
+        printer's resolution. The scaled bitmap is built once per size and
+        rebuilt whenever the base image file changes.
+
+        Args:
+            image_path: Path to the base image file
+            size: (width, height) of the label in printer pixels
+
+        Returns:
+            PIL Image in mode "1" the caller may modify freely
+        """
+        decoded = self._get_decoded(image_path)
+        key = (image_path, size)
+        with self._lock:
+            cached = self._device_images.get(key)
+            if cached is not None and cached[0] is decoded:
+                return cached[1].copy()
+
+            device_img = decoded.convert('L').resize(size, Image.LANCZOS).convert('1')
+            self._device_images[key] = (decoded, device_img)
+            return device_img.copy()
+
+    def preload(self, plans) -> int:
+        """
+        Decode the base image of every given plan.
+
+        Args:
+            plans: Iterable of RenderPlan objects
+
+        Returns:
+            Number of base images now cached
+        """
+        for plan in plans:
+            self._get_decoded(plan.base_image_path)
+        return len(self._images)
+
+    def clear(self):
+        """Forget every decoded image and reset the counters."""
+        with self._lock:
+            self._images.clear()
+            self._device_images.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "images_loaded": len(self._images),
+                "device_images_loaded": len(self._device_images),
+                "image_bytes": sum(
+                    img.width * img.height * len(img.getbands())
+                    for _, img in self._images.values()
+                ),
+            }
+
+
+# Shared by every render in this process
+base_image_cache = BaseImageCache()
+
+
+class LayerCache:
+    """
+    Process-wide LRU cache of rasterized text fields.
+
+    Each field is drawn once into its own mask layer, keyed by everything
+    that affects its pixels (field, position, font, size, spacing and text).
+    generate_png then composites the cached layers onto the base image, so a
+    single-field edit only rasterizes the field that changed.
+    """
+
+    def __init__(self, max_entries: int = 512):
+        """
+        Initialize an empty LayerCache.
+
+        Args:
+            max_entries: Maximum number of layers kept before the least
+                         recently used ones are evicted
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._layers = OrderedDict()  # layer key -> (origin, mask) or None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _rasterize(field, text: str, canvas_size: Tuple[int, int], fontmode: str):
+        """
+        Draw a field's text into a mask the size of the label, then crop it
+        to the inked area.
+
+        Returns:
+            ((x, y), mask Image) or None if the text draws nothing
+        """
+        mask = Image.new('L', canvas_size, 0)
+        d = ImageDraw.Draw(mask)
+        d.fontmode = fontmode
+        font = font_registry.get_font(field.font_path, field.font_size)
+        d.text(field.position, text, font=font, fill=255, spacing=field.spacing)
+
+        bbox = mask.getbbox()
+        if bbox is None:
+            return None
+        return (bbox[0], bbox[1]), mask.crop(bbox)
+
+    def get_layer(self, field, text: str, canvas_size: Tuple[int, int], fontmode: str):
+        """
+        Get the rasterized layer for a field's text, drawing it on a miss.
+
+        Args:
+            field: FieldPlan being drawn
+            text: Text for the field
+            canvas_size: (width, height) of the label being drawn on
+            fontmode: ImageDraw fontmode of the target ("1" or "L")
+
+        Returns:
+            ((x, y), mask Image) or None if the text draws nothing
+        """
+        key = (field.name, field.position, field.font_path, field.font_size,
+               field.spacing, text, canvas_size, fontmode)
+        with self._lock:
+            if key in self._layers:
+                self._layers.move_to_end(key)
+                self.hits += 1
+                return self._layers[key]
+            self.misses += 1
+
+        # Rasterize outside the lock so other fields can be drawn meanwhile
+        layer = self._rasterize(field, text, canvas_size, fontmode)
+
+        with self._lock:
+            self._layers[key] = layer
+            self._layers.move_to_end(key)
+            while len(self._layers) > self.max_entries:
+                self._layers.popitem(last=False)
+                self.evictions += 1
+        return layer
+
+    def clear(self):
+        """Forget every layer and reset the counters."""
+        with self._lock:
+            self._layers.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "layers_cached": len(self._layers),
+                "max_entries": self.max_entries,
+                "layer_bytes": sum(
+                    layer[1].width * layer[1].height
+                    for layer in self._layers.values() if layer is not None
+                ),
+            }
+
+
+# Shared by every render in this process
+layer_cache = LayerCache()
+
+
+class FieldPlan:
+    """
+    A single text field of a template, with its style already parsed.
+    """
+
+    def __init__(self, name: str, position: Tuple[int, int], font_path: str,
+                 font_size: int, spacing: int, style: Dict[str, Any]):
+        """
+        Initialize a FieldPlan.
+
+        Args:
+            name: Form field name (e.g. "main_text")
+            position: (x, y) where the text is drawn
+            font_path: Resolved path of the font file
+            font_size: Font size in pixels
+            spacing: Line spacing passed to ImageDraw.text
+            style: The original style dict from the template
+        """
+        self.name = name
+        self.position = position
+        self.font_path = font_path
+        self.font_size = font_size
+        self.spacing = spacing
+        self.style = style
+
+    def scaled(self, sx: float, sy: float) -> 'FieldPlan':
+        """
+        Get a copy of this field for a canvas scaled by (sx, sy). The font
+        size follows the vertical scale.
+        """
+        return FieldPlan(
+            name=self.name,
+            position=(round(self.position[0] * sx), round(self.position[1] * sy)),
+            font_path=self.font_path,
+            font_size=max(1, round(self.font_size * sy)),
+            spacing=round(self.spacing * sy),
+            style=self.style
+        )
+
+
+class RenderPlan:
+    """
+    A label template compiled into everything generate_png needs: the base
+    image path, the template offsets and the text fields in drawing order.
+    """
+
+    def __init__(self, template: Dict[str, Any], fields: List[FieldPlan],
+                 base_image_path: str, offsets: Tuple[int, int], mtime: float):
+        """
+        Initialize a RenderPlan.
+
+        Args:
+            template: Template dictionary as served by /get_templates
+            fields: Text fields in drawing order
+            base_image_path: Path to the base label image
+            offsets: Template (x, y) offsets
+            mtime: Modification time of the template file when compiled
+        """
+        self.template = template
+        self.fields = fields
+        self.base_image_path = base_image_path
+        self.offsets = offsets
+        self.mtime = mtime
+        self._scaled_fields = {}  # (sx, sy) -> List[FieldPlan]
+
+    @property
+    def label(self) -> str:
+        """Human-readable template name used in the dropdown."""
+        return self.template.get('label', '')
+
+    @property
+    def fieldnames(self) -> List[str]:
+        """Names of every field in the template, including non-text ones."""
+        return [field['name'] for field in self.template['fields']]
+
+    def scaled_fields(self, sx: float, sy: float) -> List[FieldPlan]:
+        """Get the text fields scaled by (sx, sy), computed once per scale."""
+        key = (sx, sy)
+        if key not in self._scaled_fields:
+            self._scaled_fields[key] = [field.scaled(sx, sy) for field in self.fields]
+        return self._scaled_fields[key]
+
+    @classmethod
+    def compile(cls, template_path: str) -> 'RenderPlan':
+        """
+        Load a template JSON file and compile it into a RenderPlan.
+
+        Args:
+            template_path: Path to a label_template*.json file
+
+        Returns:
+            The compiled RenderPlan
+        """
+        mtime = os.path.getmtime(template_path)
+        with open(template_path, 'r', encoding='utf-8') as f:
+            base_template = json.load(f)
+
+        # Add the filename and location to improve logging
+        template = {
+            **base_template,
+            "filename": os.path.basename(template_path),
+            "template_path": template_path,
+        }
+
+        fields = []
+        for field in template['fields']:
+            data = field['data']
+            if data['type'] != 'text':
+                continue
+
+            style = data['style']
+            fields.append(FieldPlan(
+                name=field['name'],
+                position=(field['x'], field['y']),
+                font_path=resolve_font_path(
+                    style['font-base'],
+                    style.get('bold', False),
+                    style.get('italic', False)
+                ),
+                font_size=style['size'],
+                spacing=style.get('spacing', 1),
+                style=style
+            ))
+
+        return cls(
+            template=template,
+            fields=fields,
+            base_image_path=template.get('base_image') or DEFAULT_BASE_IMAGE,
+            offsets=tuple(template.get('offsets', (0, 0))),
+            mtime=mtime
+        )
+
+
+class TemplateRegistry:
+    """
+    Process-wide cache of compiled templates.
+
+    The folder is only re-listed when its own mtime changes (a template was
+    added, removed or renamed), and each template is only recompiled when its
+    file's mtime changes.
+    """
+
+    def __init__(self, folder: str = TEMPLATE_FOLDER):
+        """
+        Initialize the TemplateRegistry.
+
+        Args:
+            folder: Folder containing label_template*.json files
+        """
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._folder_mtime = None
+        self._template_paths = []
+        self._plans = {}  # template_path -> RenderPlan
+
+    def _list_template_paths(self) -> List[str]:
+        """Return template paths, re-listing the folder only if it changed."""
+        folder_mtime = os.path.getmtime(self.folder)
+        if folder_mtime != self._folder_mtime:
+            # Template files match format label_template*.json
+            self._template_paths = sorted(
+                os.path.join(self.folder, f)
+                for f in os.listdir(self.folder)
+                if f.startswith("label_template") and f.endswith(".json")
+            )
+            self._folder_mtime = folder_mtime
+        return self._template_paths
+
+    def _get_plan_locked(self, template_path: str) -> RenderPlan:
+        """Return the plan for a path, recompiling if the file changed."""
+        plan = self._plans.get(template_path)
+        if plan is None or os.path.getmtime(template_path) != plan.mtime:
+            plan = RenderPlan.compile(template_path)
+            self._plans[template_path] = plan
+        return plan
+
+    def get_plans(self) -> Dict[str, RenderPlan]:
+        """
+        Get every template's plan, keyed by the template's 'label' property.
+        """
+        with self._lock:
+            template_paths = self._list_template_paths()
+
+            # Forget plans for templates that were removed
+            for stale_path in set(self._plans) - set(template_paths):
+                del self._plans[stale_path]
+
+            plans = {}
+            for template_path in template_paths:
+                plan = self._get_plan_locked(template_path)
+                plans[plan.label] = plan
+            return plans
+
+    def get_templates(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get every template dictionary, keyed by the template's 'label' property.
+        """
+        return {label: plan.template for label, plan in self.get_plans().items()}
+
+    def get_plan(self, label: str) -> Optional[RenderPlan]:
+        """
+        Get the plan for the template with the given 'label'.
+
+        Returns:
+            RenderPlan or None if no template has that label
+        """
+        return self.get_plans().get(label)
+
+    def get_plan_for_path(self, template_path: str) -> RenderPlan:
+        """
+        Get the plan for a specific template file, which need not live in the
+        registry's folder.
+        """
+        with self._lock:
+            return self._get_plan_locked(template_path)
+
+
+def clear_caches():
+    """
+    Empty the process-wide font, base image and layer caches, e.g. to
+    measure cold renders.
+    """
+    font_registry.clear()
+    base_image_cache.clear()
+    layer_cache.clear()
+
+
+def offset_image(img, dx, dy, mode='RGB'):
+    """
+    Offsets the image by (dx, dy), cropping or padding with white as needed.
+    The result is in `mode`.
+    """
+    left = max(0, -dx)
+    top = max(0, -dy)
+    right = img.width - max(0, dx)
+    bottom = img.height - max(0, dy)
+    cropped_img = img.crop((left, top, right, bottom))
+
+    paste_x = max(0, dx)
+    paste_y = max(0, dy)
+    offset_img = Image.new(mode, (img.width, img.height), 'white')
+    offset_img.paste(cropped_img, (paste_x, paste_y))
+
+    return offset_img
+
+
+def generate_png(plan, formdata, offset_adjustment, default_alignment=(0, 0)):
+    """
+    Generates the label image in memory according to
+    the compiled template plan, formdata, and offset_adjustment.
+    """
+    img = base_image_cache.get_copy(plan.base_image_path)
+    d = ImageDraw.Draw(img)
+
+    # Composite each field's cached text layer onto the base image
+    for field in plan.fields:
+        text = formdata.get(field.name, '')
+        layer = layer_cache.get_layer(field, text, img.size, d.fontmode)
+        if layer is not None:
+            origin, mask = layer
+            d.bitmap(origin, mask, fill=(0, 0, 0))
+
+    # Apply offsets - combine template offsets with adjustment and default alignment
+    dx = plan.offsets[0] + offset_adjustment[0] + default_alignment[0]
+    dy = plan.offsets[1] + offset_adjustment[1] + default_alignment[1]
+    return offset_image(img, dx, dy)
+
+
+def device_size(dpi=DEVICE_DPI) -> Tuple[int, int]:
+    """Get the (width, height) of a label in pixels at the given printer dpi."""
+    return (int(LABEL_SIZE_INCHES[0] * dpi[0]), int(LABEL_SIZE_INCHES[1] * dpi[1]))
+
+
+def generate_device_bitmap(plan, formdata, offset_adjustment, default_alignment=(0, 0),
+                           dpi=DEVICE_DPI):
+    """
+    Generates the label as a 1-bit bitmap at the printer's resolution, with
+    all offsets applied. The result can be sent to the printer as-is, with no
+    resize or colour conversion.
+
+    The base image and field positions are scaled from template resolution
+    to the printer's, and text is drawn straight onto the 1-bit canvas.
+    """
+    target_size = device_size(dpi)
+    template_width, template_height = base_image_cache.get_size(plan.base_image_path)
+    sx = target_size[0] / template_width
+    sy = target_size[1] / template_height
+
+    img = base_image_cache.get_device_copy(plan.base_image_path, target_size)
+    d = ImageDraw.Draw(img)
+
+    # Composite each field's cached text layer onto the base image
+    for field in plan.scaled_fields(sx, sy):
+        text = formdata.get(field.name, '')
+        layer = layer_cache.get_layer(field, text, img.size, d.fontmode)
+        if layer is not None:
+            origin, mask = layer
+            d.bitmap(origin, mask, fill=0)
+
+    # Offsets are in template pixels, so scale them along with everything else
+    dx = round((plan.offsets[0] + offset_adjustment[0] + default_alignment[0]) * sx)
+    dy = round((plan.offsets[1] + offset_adjustment[1] + default_alignment[1]) * sy)
+    return offset_image(img, dx, dy, mode='1')
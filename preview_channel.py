@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Push channel for interactive previews, using Server-Sent Events.
+
+A client opens one long-lived GET /preview_stream/<session_id> and then
+POSTs only the form fields that changed (a delta) to the same URL. The
+server merges the delta into the session's fields, renders, and pushes the
+new preview down the open stream as a "preview" event, either inline as a
+data: URI or as a version notification pointing at /preview/<session_id>.
+That replaces the multipart form POST plus separate image GET per change.
+
+```python
+channel = PreviewChannel()
+fields = channel.apply_delta(session_id, {"main_text": "Acer"})
+channel.publish(session_id, slot, request_version)
+```
+"""
+
+import json
+import base64
+import queue
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15.0
+
+
+class _Subscriber:
+    """One open event stream."""
+
+    def __init__(self, frames: bool):
+        """
+        Args:
+            frames: Push the PNG inline rather than just its version
+        """
+        self.frames = frames
+        self.events = queue.Queue()
+
+
+class PreviewChannel:
+    """
+    Per-session merged form fields and open event streams.
+    """
+
+    def __init__(self, heartbeat: float = HEARTBEAT_INTERVAL):
+        """
+        Initialize the PreviewChannel.
+
+        Args:
+            heartbeat: Seconds between keep-alive comments on idle streams
+        """
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._fields = {}       # session_id -> merged field values
+        self._subscribers = {}  # session_id -> list of _Subscriber
+        self.deltas = 0
+        self.events_sent = 0
+
+    def apply_delta(self, session_id: str, delta: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Merge changed fields into a session's current fields.
+
+        Returns:
+            A copy of the session's full set of fields
+        """
+        with self._lock:
+            fields = self._fields.setdefault(session_id, {})
+            fields.update(delta)
+            self.deltas += 1
+            return dict(fields)
+
+    def subscribe(self, session_id: str, frames: bool = True) -> _Subscriber:
+        """Register a new event stream for a session."""
+        subscriber = _Subscriber(frames)
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, session_id: str, subscriber: _Subscriber):
+        """Forget an event stream that has closed."""
+        with self._lock:
+            subscribers = self._subscribers.get(session_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(session_id, None)
+
+    def publish(self, session_id: str, slot, request_version: Optional[int] = None):
+        """
+        Push a new preview to every stream open for the session.
+
+        Args:
+            session_id: The session identifier
+            slot: PreviewSlot that was just stored
+            request_version: Client's version of the request that produced it
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, []))
+        if not subscribers:
+            return
+
+        event = {
+            "version": slot.version,
+            "request_version": request_version,
+            "etag": slot.etag,
+            "image_path": f"/preview/{session_id}?v={slot.version}",
+        }
+        frame = None
+        for subscriber in subscribers:
+            if subscriber.frames:
+                if frame is None:
+                    encoded = base64.b64encode(slot.png).decode('ascii')
+                    frame = dict(event, image=f"data:image/png;base64,{encoded}")
+                subscriber.events.put(frame)
+            else:
+                subscriber.events.put(event)
+        with self._lock:
+            self.events_sent += len(subscribers)
+
+    def close(self, session_id: str):
+        """End a session's streams and forget its fields."""
+        with self._lock:
+            self._fields.pop(session_id, None)
+            subscribers = self._subscribers.pop(session_id, [])
+        for subscriber in subscribers:
+            subscriber.events.put(None)
+
+    def stream(self, session_id: str, subscriber: _Subscriber) -> Iterator[str]:
+        """
+        Generate the text/event-stream body for one subscriber until the
+        client disconnects or the session is closed.
+        """
+        try:
+            # Tell the client to resend all fields; the server may have
+            # restarted since it last sent them
+            yield "event: ready\ndata: {}\n\n"
+            while True:
+                try:
+                    event = subscriber.events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield f"event: preview\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(session_id, subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get channel statistics."""
+        with self._lock:
+            return {
+                "sessions": len(self._fields),
+                "streams": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "deltas": self.deltas,
+                "events_sent": self.events_sent,
+            }
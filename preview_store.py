@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+In-memory storage for each session's current preview image.
+
+/preview_label encodes the label into a per-session slot instead of writing
+static/preview_images/preview_<session>.png, and /preview/<session_id>
+serves it straight from memory with an ETag. The image only reaches disk
+when /save_label or /print_label actually needs a file.
+
+Previews can also be downscaled to the size the browser shows them at and
+encoded with fast or no zlib compression (see encode_preview_png); the full
+resolution label is re-rendered when it is saved or printed.
+
+Clients number their preview requests (request_version). When a session's
+requests overlap, only the newest is rendered and stored: older ones are
+dropped before rendering if a newer request has already arrived, and after
+rendering if one arrived in the meantime (latest wins).
+
+Each slot also remembers the key of the render inputs that produced it, so
+a request that repeats the current inputs (arrow-key nudges back and forth,
+focus changes) can be answered "not modified" without rendering.
+"""
+
+import io
+import os
+import hashlib
+import threading
+from typing import Dict, Optional, Any
+from PIL import Image
+
+# zlib compress_level for each preview quality hint
+PREVIEW_COMPRESS_LEVELS = {
+    "full": 6,   # Pillow's default
+    "fast": 1,
+    "none": 0,
+}
+
+
+def encode_preview_png(img, max_width: Optional[int] = None, quality: str = "fast") -> bytes:
+    """
+    Encode a label image as a preview PNG.
+
+    Args:
+        img: Full-resolution label image
+        max_width: Downscale to at most this many pixels wide (None: keep size)
+        quality: Key of PREVIEW_COMPRESS_LEVELS
+
+    Returns:
+        Encoded PNG bytes
+    """
+    if max_width and max_width < img.width:
+        height = max(1, round(img.height * max_width / img.width))
+        img = img.resize((max_width, height), Image.BILINEAR)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG', compress_level=PREVIEW_COMPRESS_LEVELS[quality])
+    return buffer.getvalue()
+
+
+class PreviewSlot:
+    """
+    The latest preview for one session.
+    """
+
+    def __init__(self, png: bytes, version: int, request_version: Optional[int] = None,
+                 input_key: Optional[str] = None):
+        """
+        Initialize a PreviewSlot.
+
+        Args:
+            png: Encoded PNG bytes
+            version: Per-session counter, incremented on every update
+            request_version: Client's version of the request that produced it
+            input_key: Key of the render inputs (template, formdata, offsets,
+                       size and quality) that produced it
+        """
+        self.png = png
+        self.version = version
+        self.request_version = request_version
+        self.input_key = input_key
+        self.etag = hashlib.md5(png).hexdigest()
+
+
+class PreviewStore:
+    """
+    Thread-safe map of session_id -> PreviewSlot.
+    """
+
+    def __init__(self):
+        """Initialize an empty PreviewStore."""
+        self._lock = threading.Lock()
+        self._slots = {}     # session_id -> PreviewSlot
+        self._versions = {}  # session_id -> last version handed out
+        self._requested = {}  # session_id -> newest request_version seen
+        self.superseded = {"before_render": 0, "after_render": 0}
+        self.not_modified = 0
+
+    def begin_request(self, session_id: str, request_version: int) -> bool:
+        """
+        Register a numbered preview request for a session.
+
+        Returns:
+            False if a newer request for the session has already arrived
+        """
+        with self._lock:
+            if request_version < self._requested.get(session_id, request_version):
+                self.superseded["before_render"] += 1
+                return False
+            self._requested[session_id] = request_version
+            return True
+
+    def is_superseded(self, session_id: str, request_version: Optional[int],
+                      stage: str = "after_render") -> bool:
+        """
+        Check whether a newer request for the session has arrived since
+        request_version was registered. Unnumbered requests never are.
+
+        Args:
+            stage: "before_render" or "after_render", for the statistics
+        """
+        if request_version is None:
+            return False
+        with self._lock:
+            if request_version < self._requested.get(session_id, request_version):
+                self.superseded[stage] += 1
+                return True
+            return False
+
+    def get_unchanged(self, session_id: str, input_key: str) -> Optional[PreviewSlot]:
+        """
+        Get a session's current preview if it was rendered from input_key.
+
+        Returns:
+            The current PreviewSlot, or None if the inputs differ
+        """
+        with self._lock:
+            slot = self._slots.get(session_id)
+            if slot is None or slot.input_key != input_key:
+                return None
+            self.not_modified += 1
+            return slot
+
+    def put(self, session_id: str, png: bytes, request_version: Optional[int] = None,
+            input_key: Optional[str] = None) -> Optional[PreviewSlot]:
+        """
+        Store a new preview for a session, replacing the previous one.
+
+        Args:
+            session_id: The session identifier
+            png: Encoded PNG bytes
+            request_version: Client's request version, if numbered
+            input_key: Key of the render inputs that produced it
+
+        Returns:
+            The new PreviewSlot, or None if the session already holds a
+            preview from a newer request
+        """
+        with self._lock:
+            current = self._slots.get(session_id)
+            if (request_version is not None and current is not None
+                    and current.request_version is not None
+                    and current.request_version > request_version):
+                self.superseded["after_render"] += 1
+                return None
+
+            version = self._versions.get(session_id, 0) + 1
+            self._versions[session_id] = version
+            slot = PreviewSlot(png, version, request_version, input_key)
+            self._slots[session_id] = slot
+            return slot
+
+    def get(self, session_id: str) -> Optional[PreviewSlot]:
+        """Get the current preview for a session, or None."""
+        with self._lock:
+            return self._slots.get(session_id)
+
+    def remove(self, session_id: str) -> None:
+        """Forget a session's preview."""
+        with self._lock:
+            self._slots.pop(session_id, None)
+            self._versions.pop(session_id, None)
+            self._requested.pop(session_id, None)
+
+    def write_file(self, session_id: str, path: str) -> bool:
+        """
+        Write a session's current preview to disk.
+
+        Args:
+            session_id: The session identifier
+            path: Destination file path
+
+        Returns:
+            True if written, False if the session has no preview
+        """
+        slot = self.get(session_id)
+        if slot is None:
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(slot.png)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Get store statistics."""
+        with self._lock:
+            return {
+                "sessions": len(self._slots),
+                "preview_bytes": sum(len(slot.png) for slot in self._slots.values()),
+                "superseded_before_render": self.superseded["before_render"],
+                "superseded_after_render": self.superseded["after_render"],
+                "not_modified": self.not_modified,
+            }
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+Asynchronous print job queue.
+
+Print requests are queued and run on worker threads, so an HTTP request
+returns as soon as its job is queued instead of waiting while the printer
+is opened and every copy is spooled. Each job gets an ID that can be
+polled for its state, position in the queue and timings.
+
+The queue can drive several printers. Each printer has its own queue and
+worker thread; a new job is dispatched to the least busy printer whose
+media (and resolution, if the job asks for one) matches. A job that fails
+on one printer because the device failed (PrinterError) is moved to
+another compatible printer, and the failed printer is avoided for a
+cool-down period.
+
+The module-level print_queue is shared by everything that prints
+(printform-server.py and the tag manager routes), so jobs from both are
+spread over the same printers. Print functions find the printer their job
+was dispatched to with current_printer().
+
+Code running inside a job can time its stages with print_stage(); each
+job reports its own stage times and the queue keeps per-stage aggregates,
+so a slow print can be traced to the driver, image resizing or the log.
+
+```python
+from print_jobs import print_queue, print_stage, current_printer
+print_queue.set_printers({"Taglord": backend})
+job = print_queue.submit(print_label_file, image_path, copies, description="Acer palmatum")
+print_queue.get(job.id).to_dict()
+
+# Inside print_label_file
+with print_stage("log_write"):
+    append_to_print_log(...)
+```
+"""
+
+import time
+import threading
+import traceback
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from render_executor import summarize_timings
+
+# Job states
+QUEUED = "queued"
+PRINTING = "printing"
+DONE = "done"
+FAILED = "failed"
+
+# The PrintJob and printer backend in use on the current thread, for
+# print_stage() and current_printer()
+_current = threading.local()
+
+
+class NoCompatiblePrinter(Exception):
+    """Raised when no configured printer can take a job."""
+
+
+class PrinterError(Exception):
+    """
+    Raised by printer backends when the device fails before anything was
+    sent to it (opening it, its health check, starting the document). Only
+    these move a job to another printer; other errors (e.g. a page failing
+    mid-document, or writing the print log after the labels were printed)
+    fail the job, so nothing is printed twice.
+    """
+
+
+@contextmanager
+def print_stage(name: str):
+    """
+    Time a stage (e.g. "open_printer", "page", "log_write") of the print
+    job running on this thread. Stages that repeat, like pages, are
+    recorded once per occurrence. Does nothing outside a print job.
+    """
+    job = getattr(_current, "job", None)
+    if job is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        job.stages.setdefault(name, []).append(time.perf_counter() - start)
+
+
+def current_printer():
+    """
+    The printer backend the job running on this thread was dispatched to,
+    or None outside a print job (or if the queue has no printers set).
+    """
+    return getattr(_current, "printer", None)
+
+
+class PrintJob:
+    """
+    One queued call to a print function.
+    """
+
+    def __init__(self, job_id: int, fn: Callable, args, kwargs,
+                 description: str = "", copies: int = 1,
+                 media: Optional[Tuple[float, float]] = None,
+                 dpi: Optional[Tuple[int, int]] = None):
+        """
+        Initialize a PrintJob.
+
+        Args:
+            job_id: Queue-assigned ID
+            fn: Function that does the printing
+            args: Positional arguments for fn
+            kwargs: Keyword arguments for fn
+            description: Human-readable description of what's printed
+            copies: Number of copies, for display and load balancing
+            media: Label size (inches) the printer must have loaded
+            dpi: Resolution the printer must have
+        """
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.description = description
+        self.copies = copies
+        self.media = tuple(media) if media else None
+        self.dpi = tuple(dpi) if dpi else None
+        self.state = QUEUED
+        self.error = None
+        self.result = None
+        self.printer = None          # name of the printer it's queued on
+        self.failovers = []          # {"printer", "error"} for each failed attempt
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.stages = OrderedDict()  # stage name -> durations in seconds, in order
+
+    @property
+    def queue_time(self) -> float:
+        """Seconds spent waiting for the printer (so far, if still queued)."""
+        end = self.started_at or time.time()
+        return end - self.submitted_at
+
+    @property
+    def print_time(self) -> Optional[float]:
+        """Seconds spent printing (so far, if still printing)."""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self, position: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Convert to a dictionary for JSON responses.
+
+        Args:
+            position: Jobs ahead of this one (0 = next or printing), if queued
+        """
+        def iso(timestamp):
+            return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+        def ms(seconds):
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        # Stages can be far shorter than a millisecond, so keep more digits
+        stages = {
+            name: {
+                "count": len(durations),
+                "total_ms": round(sum(durations) * 1000, 3),
+                "max_ms": round(max(durations) * 1000, 3),
+            }
+            for name, durations in list(self.stages.items())
+        }
+
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "position": position,
+            "printer": self.printer,
+            "description": self.description,
+            "copies": self.copies,
+            "error": self.error,
+            "failovers": [dict(attempt) for attempt in self.failovers],
+            "submitted_at": iso(self.submitted_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "queue_ms": ms(self.queue_time),
+            "print_ms": ms(self.print_time),
+            "stages": stages,
+        }
+
+
+class _PrinterLane:
+    """One printer's queue and worker thread."""
+
+    def __init__(self, name: Optional[str], backend):
+        """
+        Args:
+            name: Printer name, or None for the queue's default lane
+            backend: PrinterBackend the lane's jobs print on, or None
+        """
+        self.name = name
+        self.backend = backend
+        self.queued = deque()    # PrintJobs waiting, oldest first
+        self.current = None      # PrintJob being printed
+        self.worker = None
+        self.retired = False     # replaced by set_printers()
+        self.failed_until = 0.0  # time.monotonic() until which it's avoided
+        self.completed = 0
+        self.failed = 0
+
+    def accepts(self, job: PrintJob) -> bool:
+        """True if this printer's media and resolution suit the job."""
+        if self.backend is None:
+            return True
+        if job.media is not None and tuple(self.backend.label_size) != job.media:
+            return False
+        if job.dpi is not None and tuple(self.backend.get_dpi()) != job.dpi:
+            return False
+        return True
+
+    def load(self) -> int:
+        """Copies queued or printing here, for picking the least busy printer."""
+        load = sum(job.copies for job in self.queued)
+        if self.current is not None:
+            load += self.current.copies
+        return load
+
+    def is_cooling_down(self) -> bool:
+        """True while the printer is avoided after a failure."""
+        return time.monotonic() < self.failed_until
+
+
+class PrintQueue:
+    """
+    Per-printer FIFO queues of PrintJobs, each run by its own worker thread.
+
+    Until set_printers() is called there is a single default lane whose
+    jobs see current_printer() as None. Finished jobs are kept (up to
+    `history`) so their status can still be looked up after they complete.
+    """
+
+    def __init__(self, history: int = 200, failover_cooldown: float = 60.0):
+        """
+        Initialize the PrintQueue. Worker threads start with their first job.
+
+        Args:
+            history: Number of finished jobs to remember, and of recent
+                     samples per stage kept for the stage aggregates
+            failover_cooldown: Seconds a printer is avoided after a job
+                               fails on it
+        """
+        self.history = history
+        self.failover_cooldown = failover_cooldown
+        self._condition = threading.Condition()
+        self._lanes = OrderedDict([(None, _PrinterLane(None, None))])  # name -> _PrinterLane
+        self._jobs = OrderedDict()     # job_id -> PrintJob, oldest first
+        self._next_id = 1
+        self._stage_times = OrderedDict()  # stage name -> recent durations
+        self.completed = 0
+        self.failed = 0
+        self.failed_over = 0
+
+    def set_printers(self, printers: Dict[str, Any]):
+        """
+        Replace the printers jobs are dispatched to. Jobs still waiting are
+        dispatched again; jobs already printing finish where they are.
+
+        Args:
+            printers: Printer name -> PrinterBackend, in order of preference
+                      when printers are equally busy
+        """
+        with self._condition:
+            old_lanes = list(self._lanes.values())
+            self._lanes = OrderedDict((name, _PrinterLane(name, backend))
+                                      for name, backend in printers.items())
+            waiting = []
+            for lane in old_lanes:
+                lane.retired = True
+                waiting.extend(lane.queued)
+                lane.queued.clear()
+            for job in sorted(waiting, key=lambda job: job.id):
+                self._dispatch_locked(job)
+            self._condition.notify_all()
+
+    def _choose_lane_locked(self, job: PrintJob, exclude=()) -> Optional[_PrinterLane]:
+        """
+        Pick the least busy printer that accepts the job, preferring ones
+        that aren't cooling down after a failure. Caller holds the lock.
+        """
+        candidates = [lane for lane in self._lanes.values()
+                      if lane.name not in exclude and lane.accepts(job)]
+        healthy = [lane for lane in candidates if not lane.is_cooling_down()]
+        # min() keeps the first of equally busy printers
+        return min(healthy or candidates, key=lambda lane: lane.load(), default=None)
+
+    def _dispatch_locked(self, job: PrintJob, front: bool = False, exclude=()) -> bool:
+        """
+        Queue a job on the best printer for it. Caller holds the lock.
+
+        Returns:
+            False if no printer accepts the job
+        """
+        lane = self._choose_lane_locked(job, exclude)
+        if lane is None:
+            return False
+        job.printer = lane.name
+        if front:
+            lane.queued.appendleft(job)
+        else:
+            lane.queued.append(job)
+        self._ensure_worker(lane)
+        return True
+
+    def _ensure_worker(self, lane: _PrinterLane):
+        """Start a lane's worker thread if it isn't running. Caller holds the lock."""
+        if lane.worker is None or not lane.worker.is_alive():
+            lane.worker = threading.Thread(target=self._work, args=(lane,),
+                                           name=f"print-queue-{lane.name or 'default'}",
+                                           daemon=True)
+            lane.worker.start()
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond `history`. Caller holds the lock."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in (DONE, FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[job_id]
+
+    def _fail_over_locked(self, job: PrintJob, lane: _PrinterLane, error: str) -> bool:
+        """
+        After a job's printer failed (PrinterError), avoid that printer for
+        a while and move the job, and any jobs waiting behind it, to other
+        printers. Caller holds the lock.
+
+        Returns:
+            True if the failed job was queued on another printer
+        """
+        lane.failed_until = time.monotonic() + self.failover_cooldown
+        job.failovers.append({"printer": lane.name, "error": error})
+        tried = {attempt["printer"] for attempt in job.failovers}
+
+        moved = False
+        if len(self._lanes) > 1 and self._dispatch_locked(job, front=True, exclude=tried):
+            job.state = QUEUED
+            job.started_at = None
+            self.failed_over += 1
+            moved = True
+
+        # Jobs waiting here would likely fail too; spread them elsewhere if
+        # a healthy printer takes them
+        for waiting in list(lane.queued):
+            target = self._choose_lane_locked(waiting, exclude=(lane.name,))
+            if target is not None and not target.is_cooling_down():
+                lane.queued.remove(waiting)
+                self._dispatch_locked(waiting, exclude=(lane.name,))
+        return moved
+
+    def _work(self, lane: _PrinterLane):
+        """Worker thread: run a lane's queued jobs in order until it's retired."""
+        while True:
+            with self._condition:
+                while not lane.queued and not lane.retired:
+                    self._condition.wait()
+                if not lane.queued:
+                    return
+                job = lane.queued.popleft()
+                job.state = PRINTING
+                job.started_at = time.time()
+                lane.current = job
+
+            _current.job = job
+            _current.printer = lane.backend
+            error = None
+            printer_failed = False
+            try:
+                job.result = job.fn(*job.args, **job.kwargs)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                printer_failed = isinstance(e, PrinterError)
+                print(f"Print job {job.id} failed on printer {lane.name}: {error}")
+                traceback.print_exc()
+            finally:
+                _current.job = None
+                _current.printer = None
+
+            with self._condition:
+                lane.current = None
+                if error is not None:
+                    lane.failed += 1
+                    if printer_failed and self._fail_over_locked(job, lane, error):
+                        self._condition.notify_all()
+                        continue
+                    job.error = error
+                    job.state = FAILED
+                    self.failed += 1
+                else:
+                    job.state = DONE
+                    lane.completed += 1
+                    self.completed += 1
+
+                # Don't hold on to images and other arguments of finished jobs
+                job.fn = job.args = job.kwargs = None
+                job.finished_at = time.time()
+                for name, durations in job.stages.items():
+                    self._stage_times.setdefault(name, deque(maxlen=self.history)).extend(durations)
+                self._forget_old_jobs()
+                self._condition.notify_all()
+
+    def submit(self, fn: Callable, *args, description: str = "", copies: int = 1,
+               media: Optional[Tuple[float, float]] = None,
+               dpi: Optional[Tuple[int, int]] = None, **kwargs) -> PrintJob:
+        """
+        Queue a print on the least busy printer that can take it.
+
+        Args:
+            fn: Function that does the printing, called as fn(*args, **kwargs)
+            description: Human-readable description of what's printed
+            copies: Number of copies, for display and load balancing
+            media: Label size (inches) the printer must have loaded
+            dpi: Resolution the printer must have
+
+        Returns:
+            The queued PrintJob
+
+        Raises:
+            NoCompatiblePrinter: If no printer has the media and resolution
+        """
+        with self._condition:
+            job = PrintJob(self._next_id, fn, args, kwargs, description, copies, media, dpi)
+            if not self._dispatch_locked(job):
+                needs = f"{media[0]}x{media[1]} in media" if media else "any media"
+                if dpi:
+                    needs += f" at {dpi[0]}x{dpi[1]} dpi"
+                raise NoCompatiblePrinter(f"No printer can take {description or 'this job'} (needs {needs})")
+            self._next_id += 1
+            self._jobs[job.id] = job
+            self._condition.notify_all()
+            return job
+
+    def printer_count(self, media: Optional[Tuple[float, float]] = None,
+                      dpi: Optional[Tuple[int, int]] = None) -> int:
+        """Number of printers (not cooling down) that could take such a job."""
+        probe = PrintJob(0, None, (), {}, media=media, dpi=dpi)
+        with self._condition:
+            return sum(1 for lane in self._lanes.values()
+                       if lane.accepts(probe) and not lane.is_cooling_down())
+
+    def get(self, job_id: int) -> Optional[PrintJob]:
+        """Get a job by ID, or None if unknown or forgotten."""
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def position(self, job: PrintJob) -> Optional[int]:
+        """
+        Jobs ahead of this one on its printer: 0 if printing or next, None
+        if finished.
+        """
+        with self._condition:
+            if job.state == PRINTING:
+                return 0
+            if job.state != QUEUED:
+                return None
+            lane = self._lanes.get(job.printer)
+            if lane is None:
+                return None
+            ahead = 1 if lane.current is not None else 0
+            for queued in lane.queued:
+                if queued is job:
+                    return ahead
+                ahead += 1
+            return None
+
+    def status(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """A job's to_dict() including its position, or None if unknown."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        return job.to_dict(self.position(job))
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        """Status of every remembered job, newest first."""
+        with self._condition:
+            jobs = list(self._jobs.values())
+        return [job.to_dict(self.position(job)) for job in reversed(jobs)]
+
+    def is_idle(self) -> bool:
+        """True if nothing is printing or waiting to print."""
+        with self._condition:
+            return all(lane.current is None and not lane.queued
+                       for lane in self._lanes.values())
+
+    def wait(self, job_id: int, timeout: Optional[float] = None) -> Optional[PrintJob]:
+        """
+        Block until a job has finished (or the timeout passes).
+
+        Returns:
+            The job, or None if unknown
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            job = self._jobs.get(job_id)
+            while job is not None and job.state in (QUEUED, PRINTING):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return job
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get queue statistics: totals, each printer's queue and backend
+        statistics, and recent timings of each stage.
+        """
+        with self._condition:
+            lanes = list(self._lanes.values())
+            printers = {}
+            for lane in lanes:
+                if lane.name is None:
+                    continue
+                printers[lane.name] = {
+                    "queued": len(lane.queued),
+                    "printing": lane.current.id if lane.current else None,
+                    "load": lane.load(),
+                    "completed": lane.completed,
+                    "failed": lane.failed,
+                    "cooling_down": lane.is_cooling_down(),
+                }
+            stats = {
+                "queued": sum(len(lane.queued) for lane in lanes),
+                "printing": [lane.current.id for lane in lanes if lane.current],
+                "completed": self.completed,
+                "failed": self.failed,
+                "failed_over": self.failed_over,
+                "stages": {name: summarize_timings(durations)
+                           for name, durations in self._stage_times.items()},
+            }
+
+        # Backends take their own locks; don't hold the queue's meanwhile
+        for lane in lanes:
+            if lane.name is not None:
+                printers[lane.name]["media"] = list(lane.backend.label_size)
+                printers[lane.name]["backend"] = lane.backend.stats()
+        stats["printers"] = printers
+        return stats
+
+
+# Shared by every module that prints
+print_queue = PrintQueue()
@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+"""
+Printer backends for the printform server.
+
+print_label_file hands finished label images to a PrinterBackend instead
+of calling win32print/win32ui directly:
+
+- GdiPrinterBackend prints through the Windows driver (needs pywin32)
+- TecRawPrinterBackend encodes labels as TEC printer language (TPCL)
+  bitmap commands and sends the bytes raw, bypassing the driver, or
+  writes them to a file
+- FileSpoolPrinterBackend writes each document's pages to a folder
+- NullPrinterBackend discards them
+
+The file and null backends can simulate a device's per-document and
+per-page time, so the whole print pipeline (queueing, rendering, logging)
+can be load tested on a machine without a printer. Every backend records
+what it printed and how long it took.
+
+DeviceBitmapCache keeps saved label files as printer-ready 1-bit bitmaps,
+so reprints skip decoding and resampling.
+
+```python
+backend = create_printer_backend("null", page_time=0.2)
+backend.print_document("acer.png", [(image, 3)])
+backend.stats()
+
+cache = DeviceBitmapCache()
+bitmap = cache.get("static/labels/generated_labels/label_x.png", backend.get_dpi())
+```
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image
+
+from label_renderer import LABEL_SIZE_INCHES, DEVICE_DPI, device_size
+from print_jobs import print_stage, PrinterError
+
+# pywin32 is only available (and only needed) on Windows
+try:
+    import win32print
+    import win32ui
+    from PIL import ImageWin
+except ImportError:
+    win32print = win32ui = ImageWin = None
+
+# GetDeviceCaps indices
+LOGPIXELSX = 88
+LOGPIXELSY = 90
+
+
+class PrinterBackend:
+    """
+    Base class for printer backends.
+
+    Subclasses implement get_dpi() and _print_pages(); print_document()
+    fits images to the label, records timings and serializes documents.
+    """
+
+    name = "base"
+
+    def __init__(self, label_size: Tuple[float, float] = LABEL_SIZE_INCHES, history: int = 100):
+        """
+        Initialize the backend.
+
+        Args:
+            label_size: (width, height) of the label in inches
+            history: Number of recent documents kept in stats()
+        """
+        self.label_size = label_size
+        self._lock = threading.Lock()  # One document at a time
+        self._stats_lock = threading.Lock()
+        self._documents = deque(maxlen=history)
+        self.documents_printed = 0
+        self.pages_printed = 0
+        self.print_seconds = 0.0
+
+    def get_dpi(self) -> Tuple[int, int]:
+        """Device resolution as (dpi_x, dpi_y)."""
+        raise NotImplementedError
+
+    def known_dpi(self) -> Optional[Tuple[int, int]]:
+        """Device resolution if it is known without asking the device, else None."""
+        return self.get_dpi()
+
+    def page_size(self) -> Tuple[int, int]:
+        """Label size in device pixels."""
+        dpi_x, dpi_y = self.get_dpi()
+        return int(self.label_size[0] * dpi_x), int(self.label_size[1] * dpi_y)
+
+    def fit_to_page(self, image):
+        """Resize an image to the page size unless it already matches."""
+        size = self.page_size()
+        if image.size != size:
+            with print_stage("resize"):
+                image = image.resize(size)
+        return image
+
+    def _print_pages(self, document_name: str, pages: List[Tuple[Any, int]]):
+        """Send fitted pages to the device. Implemented by subclasses."""
+        raise NotImplementedError
+
+    def print_document(self, document_name: str, pages: List[Tuple[Any, int]]) -> Dict[str, Any]:
+        """
+        Print one document. Several labels (and all of their copies) can go
+        in one document, so the spooler handles a whole batch as one job.
+
+        Args:
+            document_name: Name shown in the spooler
+            pages: List of (PIL image, copies); each copy is printed as a page
+
+        Returns:
+            The record of this document (see stats())
+
+        Raises:
+            PrinterError: If the device can't take the document. Backends
+                          only raise it before anything was sent to the
+                          device; later failures propagate as they are, so
+                          the job isn't printed again on another printer.
+        """
+        pages = [(self.fit_to_page(image), copies) for image, copies in pages if copies > 0]
+        page_count = sum(copies for _, copies in pages)
+
+        with self._lock:
+            start = time.perf_counter()
+            self._print_pages(document_name, pages)
+            elapsed = time.perf_counter() - start
+
+        record = {
+            "document": document_name,
+            "pages": page_count,
+            "time": datetime.now().isoformat(),
+            "print_ms": round(elapsed * 1000, 1),
+        }
+        # Separate lock so stats() doesn't wait for a document to finish
+        with self._stats_lock:
+            self._documents.append(record)
+            self.documents_printed += 1
+            self.pages_printed += page_count
+            self.print_seconds += elapsed
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        """Get backend statistics and the most recent documents."""
+        # Never asks the device, so stats work while it's offline
+        dpi = self.known_dpi()
+        with self._stats_lock:
+            return {
+                "backend": self.name,
+                "dpi": list(dpi) if dpi else None,
+                "documents": self.documents_printed,
+                "pages": self.pages_printed,
+                "print_ms": round(self.print_seconds * 1000, 1),
+                "recent": list(self._documents),
+            }
+
+
+class GdiPrinterBackend(PrinterBackend):
+    """
+    Prints through the Windows printer driver with win32print/win32ui.
+
+    The printer handle and device context are opened once and reused for
+    every document. A connection that has been idle for longer than
+    health_check_interval is checked before use, and one that fails (a
+    health check or a print) is closed and reopened for the next document.
+    """
+
+    name = "gdi"
+
+    def __init__(self, printer_name: str, health_check_interval: float = 30.0, **kwargs):
+        """
+        Args:
+            printer_name: Windows printer name
+            health_check_interval: Seconds a connection may sit idle before
+                                   it is checked again
+        """
+        if win32print is None:
+            raise RuntimeError("The gdi printer backend needs pywin32 (Windows only)")
+        super().__init__(**kwargs)
+        self.printer_name = printer_name
+        self.health_check_interval = health_check_interval
+        self._dpi = None
+        # Guards the connection; reentrant because page_size() -> get_dpi()
+        # runs while a document holds it
+        self._connection_lock = threading.RLock()
+        self._hprinter = None
+        self._printer_dc = None
+        self._last_used = 0.0
+        self.opens = 0
+        self.health_checks = 0
+        self.health_failures = 0
+        self.print_errors = 0
+
+    def _open_locked(self):
+        """Open the printer handle and device context."""
+        with print_stage("open_printer"):
+            hprinter = win32print.OpenPrinter(self.printer_name)
+            try:
+                printer_dc = win32ui.CreateDC()
+                printer_dc.CreatePrinterDC(self.printer_name)
+            except Exception:
+                win32print.ClosePrinter(hprinter)
+                raise
+        self._hprinter = hprinter
+        self._printer_dc = printer_dc
+        self._last_used = time.monotonic()
+        self.opens += 1
+
+    def _close_locked(self):
+        """Close the connection, ignoring errors from an already broken one."""
+        printer_dc, hprinter = self._printer_dc, self._hprinter
+        self._printer_dc = self._hprinter = None
+        if printer_dc is not None:
+            try:
+                printer_dc.DeleteDC()
+            except Exception:
+                pass
+        if hprinter is not None:
+            try:
+                win32print.ClosePrinter(hprinter)
+            except Exception:
+                pass
+
+    def _is_healthy_locked(self) -> bool:
+        """Check that the printer handle and device context still work."""
+        self.health_checks += 1
+        try:
+            with print_stage("health_check"):
+                win32print.GetPrinter(self._hprinter, 2)
+                self._printer_dc.GetDeviceCaps(LOGPIXELSX)
+            return True
+        except Exception as e:
+            self.health_failures += 1
+            print(f"Warning: Connection to printer {self.printer_name} failed its health check: {e}")
+            return False
+
+    def _connect_locked(self):
+        """Get the open device context, opening or reopening it if needed."""
+        if (self._printer_dc is not None
+                and time.monotonic() - self._last_used > self.health_check_interval
+                and not self._is_healthy_locked()):
+            self._close_locked()
+        if self._printer_dc is None:
+            self._open_locked()
+        return self._printer_dc
+
+    def get_dpi(self) -> Tuple[int, int]:
+        """Ask the driver for its resolution once, then remember it."""
+        if self._dpi is None:
+            with self._connection_lock:
+                try:
+                    printer_dc = self._connect_locked()
+                    self._dpi = (printer_dc.GetDeviceCaps(LOGPIXELSX), printer_dc.GetDeviceCaps(LOGPIXELSY))
+                except Exception as e:
+                    self._close_locked()
+                    raise PrinterError(f"Can't reach printer {self.printer_name}: {e}") from e
+        return self._dpi
+
+    def known_dpi(self) -> Optional[Tuple[int, int]]:
+        return self._dpi
+
+    def _start_doc_locked(self, document_name):
+        """
+        Start a document, reopening the connection and trying once more if
+        that fails (a stale connection fails here). Nothing has reached the
+        printer yet, so failing twice raises PrinterError and the job can go
+        to another printer.
+        """
+        for attempt in range(2):
+            try:
+                printer_dc = self._connect_locked()
+                with print_stage("start_doc"):
+                    printer_dc.StartDoc(document_name)
+                return printer_dc
+            except Exception as e:
+                self.print_errors += 1
+                self._close_locked()
+                if attempt:
+                    raise PrinterError(f"Can't start a document on printer {self.printer_name}: {e}") from e
+                print(f"Warning: Reopening printer {self.printer_name} after error: {e}")
+
+    def _print_pages(self, document_name, pages):
+        with self._connection_lock:
+            width, height = self.page_size()
+            printer_dc = self._start_doc_locked(document_name)
+
+            try:
+                for image, copies in pages:
+                    # One DIB per label, drawn on each of its pages
+                    with print_stage("dib"):
+                        dib = ImageWin.Dib(image)
+                    for _ in range(copies):
+                        with print_stage("page"):
+                            printer_dc.StartPage()
+                            dib.draw(printer_dc.GetHandleOutput(), (0, 0, width, height))
+                            printer_dc.EndPage()
+                with print_stage("end_doc"):
+                    printer_dc.EndDoc()
+            except Exception:
+                # Pages may already be spooled, so don't retry or fail over;
+                # just make sure the next document gets a fresh connection
+                self.print_errors += 1
+                try:
+                    printer_dc.AbortDoc()
+                except Exception:
+                    pass
+                self._close_locked()
+                raise
+            self._last_used = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Get backend statistics, including the printer connection's."""
+        stats = super().stats()
+        # Read without the connection lock, which is held while printing
+        stats["connection"] = {
+            "open": self._printer_dc is not None,
+            "opens": self.opens,
+            "health_checks": self.health_checks,
+            "health_failures": self.health_failures,
+            "print_errors": self.print_errors,
+        }
+        return stats
+
+
+class NullPrinterBackend(PrinterBackend):
+    """
+    Discards pages, optionally taking as long as a real device would.
+    """
+
+    name = "null"
+
+    def __init__(self, dpi: Tuple[int, int] = DEVICE_DPI, document_time: float = 0.0,
+                 page_time: float = 0.0, **kwargs):
+        """
+        Args:
+            dpi: Resolution to report
+            document_time: Simulated seconds to open and close each document
+            page_time: Simulated seconds per printed page
+        """
+        super().__init__(**kwargs)
+        self.dpi = tuple(dpi)
+        self.document_time = document_time
+        self.page_time = page_time
+
+    def get_dpi(self) -> Tuple[int, int]:
+        return self.dpi
+
+    def _simulate(self, pages):
+        """Sleep for the simulated device time of a document."""
+        delay = self.document_time + self.page_time * sum(copies for _, copies in pages)
+        if delay > 0:
+            with print_stage("simulated_device"):
+                time.sleep(delay)
+
+    def _print_pages(self, document_name, pages):
+        self._simulate(pages)
+
+
+class FileSpoolPrinterBackend(NullPrinterBackend):
+    """
+    Writes each document to its own folder in spool_dir: one PNG per
+    distinct page image plus document.json listing the pages and copies.
+    """
+
+    name = "file"
+
+    def __init__(self, spool_dir: str = "static/print_spool", **kwargs):
+        """
+        Args:
+            spool_dir: Folder documents are written to
+            (other arguments as for NullPrinterBackend)
+        """
+        super().__init__(**kwargs)
+        self.spool_dir = spool_dir
+        self._sequence = 0
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def _print_pages(self, document_name, pages):
+        self._sequence += 1
+        safe_name = re.sub(r'[^a-zA-Z0-9._-]', '_', document_name)
+        folder = os.path.join(self.spool_dir,
+                              f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{self._sequence:04d}_{safe_name}")
+        os.makedirs(folder, exist_ok=True)
+
+        manifest = []
+        for index, (image, copies) in enumerate(pages, start=1):
+            filename = f"page_{index:03d}.png"
+            with print_stage("page"):
+                image.save(os.path.join(folder, filename))
+            manifest.append({"file": filename, "copies": copies, "size": list(image.size)})
+        with open(os.path.join(folder, "document.json"), 'w', encoding='utf-8') as f:
+            json.dump({"document": document_name, "dpi": list(self.dpi), "pages": manifest}, f, indent=2)
+
+        self._simulate(pages)
+
+
+def encode_tpcl(pages: List[Tuple[Any, int]], dpi: Tuple[int, int],
+                label_size: Tuple[float, float] = LABEL_SIZE_INCHES, gap_mm: float = 3.0,
+                sensor: int = 2, speed: int = 3, ribbon: int = 0) -> bytes:
+    """
+    Encode labels as a TEC Printer Command Language (TPCL) job.
+
+    The label size is set once, then each label is drawn as one bitmap
+    graphic ({SG;...|}, hex mode: 8 dots per byte, 1 = black) and issued
+    `copies` times. Coordinates and sizes are in 0.1 mm, as TPCL expects.
+
+    Args:
+        pages: List of (PIL image at the printer's resolution, copies)
+        dpi: Printer resolution as (dpi_x, dpi_y)
+        label_size: (width, height) of the label in inches
+        gap_mm: Gap between labels on the liner, in mm
+        sensor: Media sensor (0 none, 1 reflective, 2 transmissive)
+        speed: Issue speed code
+        ribbon: 0 for direct thermal, 1 or 2 for thermal transfer
+
+    Returns:
+        The job as bytes
+    """
+    width = round(label_size[0] * 254)   # 0.1 mm
+    length = round(label_size[1] * 254)
+    pitch = length + round(gap_mm * 10)
+
+    job = [f"{{D{pitch:04d},{width:04d},{length:04d}|}}".encode('ascii')]
+    for image, copies in pages:
+        if image.mode != '1':
+            image = image.convert('L').convert('1')
+        # "1;I" packs black pixels as 1 bits, as the printer expects
+        data = image.tobytes('raw', '1;I')
+        job.append(b"{C|}")
+        job.append(f"{{SG;0000,00000,{image.width:04d},{image.height:05d},1,".encode('ascii'))
+        job.append(data)
+        job.append(b"|}")
+        job.append(f"{{XS;I,{copies:04d},000{sensor}C{speed}{ribbon}00|}}".encode('ascii'))
+    return b"".join(job)
+
+
+class TecRawPrinterBackend(PrinterBackend):
+    """
+    Sends labels to a TEC printer as raw TPCL bitmap commands (see
+    encode_tpcl), so neither GDI nor the driver rasterizes them.
+
+    With output_dir, each document's byte stream is written to a .tpcl
+    file there instead of being sent, for testing without a printer.
+    """
+
+    name = "tec"
+
+    def __init__(self, printer_name: Optional[str] = None, output_dir: Optional[str] = None,
+                 dpi: Tuple[int, int] = DEVICE_DPI, gap_mm: float = 3.0, sensor: int = 2,
+                 speed: int = 3, ribbon: int = 0, **kwargs):
+        """
+        Args:
+            printer_name: Windows printer to send raw jobs to
+            output_dir: Write jobs to files here instead of sending them
+            dpi: Printer resolution; raw jobs can't ask the driver for it
+            (other arguments as for encode_tpcl)
+        """
+        if output_dir is None and win32print is None:
+            raise RuntimeError("Sending raw jobs to the printer needs pywin32 (Windows only); "
+                               "set output_dir to write them to files instead")
+        super().__init__(**kwargs)
+        self.printer_name = printer_name
+        self.output_dir = output_dir
+        self.dpi = tuple(dpi)
+        self.gap_mm = gap_mm
+        self.sensor = sensor
+        self.speed = speed
+        self.ribbon = ribbon
+        self._sequence = 0
+        self.bytes_sent = 0
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def get_dpi(self) -> Tuple[int, int]:
+        return self.dpi
+
+    def _print_pages(self, document_name, pages):
+        with print_stage("encode"):
+            job = encode_tpcl(pages, self.dpi, self.label_size, gap_mm=self.gap_mm,
+                              sensor=self.sensor, speed=self.speed, ribbon=self.ribbon)
+        self._sequence += 1
+        self.bytes_sent += len(job)
+
+        if self.output_dir is not None:
+            safe_name = re.sub(r'[^a-zA-Z0-9._-]', '_', document_name)
+            path = os.path.join(self.output_dir,
+                                f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{self._sequence:04d}_{safe_name}.tpcl")
+            with print_stage("write"), open(path, 'wb') as f:
+                f.write(job)
+            return
+
+        # Failures before the job is written can fail over to another
+        # printer; once WritePrinter has run the labels may be printing
+        try:
+            with print_stage("open_printer"):
+                hprinter = win32print.OpenPrinter(self.printer_name)
+        except Exception as e:
+            raise PrinterError(f"Can't open printer {self.printer_name}: {e}") from e
+        try:
+            try:
+                with print_stage("start_doc"):
+                    win32print.StartDocPrinter(hprinter, 1, (document_name, None, "RAW"))
+            except Exception as e:
+                raise PrinterError(f"Can't start a document on printer {self.printer_name}: {e}") from e
+            try:
+                with print_stage("write"):
+                    win32print.StartPagePrinter(hprinter)
+                    win32print.WritePrinter(hprinter, job)
+                    win32print.EndPagePrinter(hprinter)
+            finally:
+                with print_stage("end_doc"):
+                    win32print.EndDocPrinter(hprinter)
+        finally:
+            win32print.ClosePrinter(hprinter)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get backend statistics, including bytes sent."""
+        stats = super().stats()
+        stats["bytes_sent"] = self.bytes_sent
+        return stats
+
+
+def image_bytes(image) -> int:
+    """Approximate memory used by a PIL image's pixels."""
+    if image.mode == '1':
+        return (image.width + 7) // 8 * image.height
+    return image.width * image.height * len(image.getbands())
+
+
+class DeviceBitmapCache:
+    """
+    LRU cache of label image files converted to printer-ready bitmaps:
+    scaled to the label size at the printer's resolution and dithered to
+    1-bit, so the backend sends them without resizing.
+
+    Entries are keyed by (image path, file mtime, dpi), so a label file
+    that is rewritten gets a fresh bitmap. Cached bitmaps are shared and
+    must not be modified.
+    """
+
+    def __init__(self, budget: int = 16 * 1024 * 1024):
+        """
+        Initialize the DeviceBitmapCache.
+
+        Args:
+            budget: Maximum bytes of bitmaps kept
+        """
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._bitmaps = OrderedDict()  # (path, mtime, dpi) -> 1-bit Image, oldest first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_path: str, dpi: Tuple[int, int]):
+        """
+        Get a label file as a 1-bit bitmap at the printer's resolution.
+
+        Args:
+            image_path: Path to the label image file
+            dpi: Printer resolution as (dpi_x, dpi_y)
+
+        Returns:
+            PIL Image in mode "1" (shared; do not modify)
+        """
+        key = (image_path, os.path.getmtime(image_path), tuple(dpi))
+        with self._lock:
+            bitmap = self._bitmaps.get(key)
+            if bitmap is not None:
+                self._bitmaps.move_to_end(key)
+                self.hits += 1
+                return bitmap
+            self.misses += 1
+
+        # Decode and resample outside the lock; two threads missing on the
+        # same file just build it twice
+        with print_stage("load_image"), Image.open(image_path) as img:
+            gray = img.convert('L')
+        with print_stage("resize"):
+            bitmap = gray.resize(device_size(dpi), Image.LANCZOS).convert('1')
+
+        with self._lock:
+            if key not in self._bitmaps:
+                # Bitmaps of earlier versions of the file won't be asked for again
+                for stale in [k for k in self._bitmaps if k[0] == image_path and k[2] == key[2]]:
+                    self._bytes -= image_bytes(self._bitmaps.pop(stale))
+                self._bitmaps[key] = bitmap
+                self._bytes += image_bytes(bitmap)
+                self._evict_locked()
+        return bitmap
+
+    def _evict_locked(self):
+        """Drop the least recently used bitmaps until under the budget."""
+        while self._bytes > self.budget and len(self._bitmaps) > 1:
+            _, evicted = self._bitmaps.popitem(last=False)
+            self._bytes -= image_bytes(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        """Forget every bitmap and reset the counters."""
+        with self._lock:
+            self._bitmaps.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._bitmaps),
+                "bytes": self._bytes,
+                "budget": self.budget,
+            }
+
+
+# Backend name -> class, for create_printer_backend
+PRINTER_BACKENDS = {
+    GdiPrinterBackend.name: GdiPrinterBackend,
+    TecRawPrinterBackend.name: TecRawPrinterBackend,
+    FileSpoolPrinterBackend.name: FileSpoolPrinterBackend,
+    NullPrinterBackend.name: NullPrinterBackend,
+}
+
+
+def create_printer_backend(name: str, **kwargs) -> PrinterBackend:
+    """
+    Create a backend by name ("gdi", "tec", "file" or "null").
+
+    Raises:
+        ValueError: If the name is unknown
+    """
+    backend_class = PRINTER_BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown printer backend: {name}")
+    return backend_class(**kwargs)
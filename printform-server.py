@@ -1,23 +1,39 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from PIL import Image, ImageDraw, ImageFont, ImageWin
+from flask import Flask, Response, g, render_template, request, jsonify, send_from_directory, send_file
 import os
+import io
 import csv
+import base64
+import hashlib
 import json
 import re
 import codecs
 import shutil
-import win32print
-import win32ui
 from datetime import datetime
 import threading
 import time
 import signal
 import sys
+import importlib.util
 from tag_routes import register_tag_routes
 from plant_tag import PlantTagDatabase
+from label_renderer import (TemplateRegistry, generate_png, generate_device_bitmap,
+                            font_registry, base_image_cache, layer_cache, LABEL_SIZE_INCHES)
+from batch_render import BatchRenderer, BatchTooLarge
+from preview_store import PreviewStore, encode_preview_png, PREVIEW_COMPRESS_LEVELS
+from session_store import SessionStore
+from preview_channel import PreviewChannel
+from render_executor import RenderExecutor, RenderQueueFull
+from print_jobs import print_queue, print_stage, current_printer, NoCompatiblePrinter
+from printer_backends import create_printer_backend, DeviceBitmapCache
+from render_cache import RenderCache, render_key
 from difflib import SequenceMatcher
 
+# Batch render workers are spawned processes, which re-run the main script;
+# start them from batch_render instead so each doesn't set up another server
+if __name__ == '__main__':
+    __spec__ = importlib.util.find_spec('batch_render')
+
 ###############################################################################
 # AUTO-RESTART SYSTEM
 ###############################################################################
@@ -97,6 +113,13 @@ def perform_restart():
     # Wait for any critical operations to complete (up to 10 seconds)
     if restart_lock.acquire(timeout=10):
         restart_lock.release()
+
+        # Queued print jobs would be lost, so let the queue drain first
+        if not print_queue.is_idle():
+            print(f"[{datetime.now().isoformat()}] Restart delayed - print jobs in progress")
+            schedule_restart()
+            return
+
         print(f"[{datetime.now().isoformat()}] Performing graceful restart...")
         
         # Send restart signal to main process
@@ -133,6 +156,50 @@ app = Flask(__name__)
 # Adjust printer name to match your Windows printer
 PRINTER_NAME = "Taglord (TEC B-SX5T) (305 dpi)"
 
+# Resolution labels are rendered at for printing; should match PRINTER_NAME
+PRINTER_DPI = (305, 305)
+
+# How labels reach the printer: "gdi" (the Windows driver, needs pywin32),
+# "tec" (raw TEC printer language to PRINTER_NAME, bypassing the driver),
+# "file" (write each document's pages to PRINT_SPOOL_FOLDER) or "null"
+# (discard them). The file and null backends take the simulated device
+# times below, for load testing without a printer. Each can be overridden
+# with an environment variable, e.g. PRINTFORM_PRINTER_BACKEND=file
+PRINTER_BACKEND = os.environ.get('PRINTFORM_PRINTER_BACKEND',
+                                 'gdi' if sys.platform == 'win32' else 'null')
+PRINT_SPOOL_FOLDER = os.environ.get('PRINTFORM_PRINT_SPOOL_FOLDER', 'static/print_spool')
+SIMULATED_DOCUMENT_TIME = float(os.environ.get('PRINTFORM_SIMULATED_DOCUMENT_TIME', 0.0))
+SIMULATED_PAGE_TIME = float(os.environ.get('PRINTFORM_SIMULATED_PAGE_TIME', 0.0))
+
+# The gdi backend keeps its printer connection open between prints and
+# checks it again after this many idle seconds
+PRINTER_HEALTH_CHECK_INTERVAL = 30
+
+# The tec backend writes its raw jobs here instead of sending them when
+# set (PRINTFORM_TEC_OUTPUT_FOLDER), and needs the gap between labels
+TEC_OUTPUT_FOLDER = os.environ.get('PRINTFORM_TEC_OUTPUT_FOLDER')
+TEC_LABEL_GAP_MM = 3.0
+
+# Label printers jobs are spread across, least busy first. Each entry names
+# the printer and picks a backend as PRINTER_BACKEND does; "dpi" is the
+# resolution for backends that can't ask a driver, "media" the label size
+# (inches) loaded and "options" any extra backend arguments. A JSON list of
+# entries in PRINTERS_CONFIG_FILE, if it exists, replaces this one
+PRINTERS = [
+    {"name": PRINTER_NAME, "backend": PRINTER_BACKEND, "dpi": PRINTER_DPI, "media": LABEL_SIZE_INCHES},
+]
+PRINTERS_CONFIG_FILE = os.environ.get('PRINTFORM_PRINTERS_FILE', 'printers.json')
+
+# Seconds a printer is avoided after a job fails on it; the job and the
+# printer's waiting jobs move to other printers
+PRINTER_FAILOVER_COOLDOWN = 60
+
+# Smallest share (in copies) of a /print_batch worth sending to another printer
+PRINT_BATCH_SPLIT_COPIES = 10
+
+# Memory budget for saved labels and tags kept as printer-ready bitmaps
+PRINT_BITMAP_CACHE_BUDGET = 16 * 1024 * 1024
+
 # Single preview folder and file naming for each session
 PREVIEW_FOLDER = 'static/preview_images'
 os.makedirs(PREVIEW_FOLDER, exist_ok=True)
@@ -147,6 +214,16 @@ SAVED_INDEX_FILE = 'saved-label-index.json'
 # Print log file that will track print jobs
 PRINT_LOG_FILE = 'print-log.json'
 
+# Sessions kept in temp_label_store, and how long (seconds) an unused
+# session is kept before it and its preview are discarded
+SESSION_MAX_ENTRIES = 500
+SESSION_IDLE_TTL = 2 * 60 * 60
+
+# Threads that render previews, and how many preview renders may wait for
+# one before /preview_label answers 503
+RENDER_WORKERS = 2
+RENDER_QUEUE_LIMIT = 8
+
 # Paths for label template JSON
 #  (We still keep this as a default, in case user doesn't pick any template_name)
 label_template_path = 'static/label-templates/label_template_default.json'
@@ -160,19 +237,101 @@ label_template_path = 'static/label-templates/label_template_default.json'
 #       "date_created": "YYYY-MM-DDTHH:MM:SS",
 #       "preview_filename": "preview_<session_id>.png"
 #   }
+# Sessions idle for SESSION_IDLE_TTL, or beyond SESSION_MAX_ENTRIES, are
+# evicted along with their preview (see discard_session).
 ###############################################################################
-temp_label_store = {}
+def discard_session(session_id, entry):
+    """
+    Cleans up after a session evicted from temp_label_store: forgets its
+    in-memory preview and deletes its preview_<session_id>.png file.
+    """
+    preview_store.remove(session_id)
+    preview_channel.close(session_id)
+    preview_path = os.path.join(app.root_path, PREVIEW_FOLDER, f"preview_{session_id}.png")
+    try:
+        os.remove(preview_path)
+    except FileNotFoundError:
+        pass
+
+temp_label_store = SessionStore(
+    max_entries=SESSION_MAX_ENTRIES,
+    idle_ttl=SESSION_IDLE_TTL,
+    on_evict=discard_session
+)
 
 # Initialize PlantTag database
 plant_tag_db = PlantTagDatabase()
 
+# Compiled label templates, reloaded only when a template file changes
+template_registry = TemplateRegistry()
+
+# Rendered labels keyed by tag exact hash + template version
+render_cache = RenderCache()
+
+# Process pool for /batch_render, started on first use
+batch_renderer = BatchRenderer(cache=render_cache)
+
+# Latest preview PNG for each session, served by /preview/<session_id>
+preview_store = PreviewStore()
+
+# Open /preview_stream connections and their sessions' current fields
+preview_channel = PreviewChannel()
+
+# Preview renders run here rather than on request threads
+render_executor = RenderExecutor(max_workers=RENDER_WORKERS, max_queue=RENDER_QUEUE_LIMIT)
+
+def load_printer_configs():
+    """
+    Returns the printer entries from PRINTERS_CONFIG_FILE if it exists,
+    otherwise PRINTERS.
+    """
+    config_path = os.path.join(app.root_path, PRINTERS_CONFIG_FILE)
+    if os.path.exists(config_path):
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return PRINTERS
+
+def create_configured_printer_backend(config):
+    """
+    Creates the printer backend for one printer entry (see PRINTERS).
+    """
+    backend = config.get('backend', PRINTER_BACKEND)
+    dpi = tuple(config.get('dpi', PRINTER_DPI))
+    # Printers that write files get a folder each so their documents don't collide
+    folder_name = re.sub(r'[^a-zA-Z0-9._-]', '_', config['name'])
+
+    if backend == 'gdi':
+        options = {"printer_name": config['name'],
+                   "health_check_interval": PRINTER_HEALTH_CHECK_INTERVAL}
+    elif backend == 'tec':
+        options = {"printer_name": config['name'], "dpi": dpi, "gap_mm": TEC_LABEL_GAP_MM,
+                   "output_dir": os.path.join(TEC_OUTPUT_FOLDER, folder_name) if TEC_OUTPUT_FOLDER else None}
+    else:
+        options = {"dpi": dpi, "document_time": SIMULATED_DOCUMENT_TIME,
+                   "page_time": SIMULATED_PAGE_TIME}
+        if backend == 'file':
+            options["spool_dir"] = os.path.join(PRINT_SPOOL_FOLDER, folder_name)
+
+    options["label_size"] = tuple(config.get('media', LABEL_SIZE_INCHES))
+    options.update(config.get('options', {}))
+    return create_printer_backend(backend, **options)
+
+# Print jobs are dispatched over the configured printers
+print_queue.failover_cooldown = PRINTER_FAILOVER_COOLDOWN
+print_queue.set_printers({config['name']: create_configured_printer_backend(config)
+                          for config in load_printer_configs()})
+
+# Label files converted for each printer's resolution, reused by reprints
+device_bitmap_cache = DeviceBitmapCache(budget=PRINT_BITMAP_CACHE_BUDGET)
+
 ###############################################################################
 # INITIALIZATION
 ###############################################################################
 
 def main():
     """
-    Initialize the server and start the auto-restart timer.
+    Initialize the server, start the auto-restart timer and preload fonts
+    and base images.
     
     This function is called when the server starts and sets up the auto-restart
     system to prevent search bugs that occur during extended server operation.
@@ -181,40 +340,51 @@ def main():
     schedule_restart()
     print(f"[{datetime.now().isoformat()}] Auto-restart timer started (every {restart_interval} seconds)")
 
-def load_templates():
-    """
-    ### ADDED ###
-    Loads all template files in static/label-templates that match label_template*.json,
-    returning a dict keyed by each file's 'label' property. That 'label' is
-    the human-readable name that goes in the dropdown.
-    """
-    templates = {}
+    # Load the fonts and base images every template uses before the first
+    # preview needs them
+    plans = template_registry.get_plans().values()
+    font_count = font_registry.preload(plans)
+    image_count = base_image_cache.preload(plans)
+    print(f"[{datetime.now().isoformat()}] Preloaded {font_count} fonts and {image_count} base images")
 
-    # Locate all template files in this directory
-    # Template files match format label_template*.json
-    template_folder_path = "static/label-templates"
-    template_file_paths = [
-        os.path.join(template_folder_path, f)
-        for f in os.listdir(template_folder_path)
-        if f.startswith("label_template") and f.endswith(".json")
-    ]
+    # Sessions don't survive a restart, so clear out their old preview files
+    removed_count = remove_stale_preview_files()
+    print(f"[{datetime.now().isoformat()}] Removed {removed_count} stale preview files")
 
-    for template_path in template_file_paths:
-        # Load label template
-        with open(template_path, 'r', encoding='utf-8') as f:
-            base_template = json.load(f)
+def remove_stale_preview_files():
+    """
+    Deletes preview_<session_id>.png files in PREVIEW_FOLDER that haven't
+    been written for SESSION_IDLE_TTL seconds.
 
-        # Add the filename and location to improve logging
-        template = {
-            **base_template,
-            "filename": os.path.basename(template_path),
-            "template_path": template_path,
-        }
+    Returns:
+        Number of files removed
+    """
+    preview_dir = os.path.join(app.root_path, PREVIEW_FOLDER)
+    cutoff = time.time() - SESSION_IDLE_TTL
+    removed_count = 0
+    for filename in os.listdir(preview_dir):
+        if not (filename.startswith('preview_') and filename.endswith('.png')):
+            continue
+        path = os.path.join(preview_dir, filename)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed_count += 1
+        except OSError:
+            pass  # Removed or in use; try again next start
+    return removed_count
 
-        # "label" is a field in each JSON that identifies this template
-        templates[template['label']] = template
+def load_templates():
+    """
+    ### ADDED ###
+    Returns all template files in static/label-templates that match label_template*.json,
+    as a dict keyed by each file's 'label' property. That 'label' is
+    the human-readable name that goes in the dropdown.
 
-    return templates
+    Templates come from template_registry, so files are only re-read when
+    they change on disk.
+    """
+    return template_registry.get_templates()
 
 ###############################################################################
 # UTILITY FUNCTIONS
@@ -227,63 +397,6 @@ def sanitize_string(s):
 def unescape_string(s):
     return codecs.decode(s, 'unicode_escape')
 
-def offset_image(img, dx, dy):
-    """Offsets the image by (dx, dy), cropping or padding with white as needed."""
-    left = max(0, -dx)
-    top = max(0, -dy)
-    right = img.width - max(0, dx)
-    bottom = img.height - max(0, dy)
-    cropped_img = img.crop((left, top, right, bottom))
-
-    paste_x = max(0, dx)
-    paste_y = max(0, dy)
-    offset_img = Image.new('RGB', (img.width, img.height), (255, 255, 255))
-    offset_img.paste(cropped_img, (paste_x, paste_y))
-
-    return offset_img
-
-def generate_png(template, formdata, offset_adjustment, default_alignment=(0, 0)):
-    """
-    Generates the label image in memory according to
-    the template, formdata, and offset_adjustment.
-    """
-    label_base_path = template['base_image'] or "static/label-templates/label_base.png"
-    
-    img = Image.open(label_base_path)
-    d = ImageDraw.Draw(img)
-
-    for field in template['fields']:
-        name = field['name']
-        x, y = field['x'], field['y']
-        data = field['data']
-        text = formdata.get(name, '')
-
-        if data['type'] == 'text':
-            font_base = data['style']['font-base']
-            font_size = data['style']['size']
-            bold = data['style'].get('bold', False)
-            italic = data['style'].get('italic', False)
-            spacing = data['style'].get('spacing', 1)
-
-            # Build the actual font path
-            # (retain the user's original comment)
-            if bold and italic:
-                font_path = font_base.replace(".ttf", "bi.ttf")
-            elif bold:
-                font_path = font_base.replace(".ttf", "bd.ttf")
-            elif italic:
-                font_path = font_base.replace(".ttf", "i.ttf")
-            else:
-                font_path = font_base
-
-            font = ImageFont.truetype(font_path, font_size)
-            d.text((x, y), text, font=font, fill=(0, 0, 0), spacing=spacing)
-
-    # Apply offsets - combine template offsets with adjustment and default alignment
-    dx = template["offsets"][0] + offset_adjustment[0] + default_alignment[0]
-    dy = template["offsets"][1] + offset_adjustment[1] + default_alignment[1]
-    return offset_image(img, dx, dy)
-
 def append_to_saved_index(entry):
     """
     Appends a record to saved-label-index.json, creating if needed.
@@ -315,7 +428,10 @@ def append_to_saved_index(entry):
         # Always release the lock, even if an exception occurs
         release_restart_lock()
 
-def append_to_print_log(session_id, copies):
+# Serializes print-log.json updates from the printers' worker threads
+print_log_lock = threading.Lock()
+
+def append_to_print_log(session_id, copies, entry_data=None):
     """
     Appends a record to print-log.json containing the form data, template,
     and offset adjustments used to generate the label. These are loaded from temp_label_store.
@@ -326,81 +442,241 @@ def append_to_print_log(session_id, copies):
     Args:
         session_id (str): The session identifier
         copies (int): Number of copies printed
+        entry_data (dict): The session's temp_label_store entry as it was when
+                           the print was requested (default: look it up now)
     """
     # Acquire restart lock to prevent restart during file write
     if not acquire_restart_lock("writing print log"):
         print("Warning: Could not acquire restart lock for log operation")
     
     try:
-        log_path = os.path.join(app.root_path, PRINT_LOG_FILE)
-        if os.path.exists(log_path):
-            with open(log_path, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        else:
-            logs = []
-
-        entry_data = temp_label_store.get(session_id, {})
-        used_formdata = entry_data.get('used_formdata', {})
-        label_template = entry_data.get('label_template', {})
-        offset_adjustment = entry_data.get('offset_adjustment', (0, 0))
-        default_alignment = entry_data.get('default_alignment', (0, 0))
-
-        log_entry = {
-            "session_id": session_id,
-            "count": copies,
-            "formdata": used_formdata,        # the data used in generate_png
-            "offset_adjustment": offset_adjustment, # the offset adjustments applied
-            "default_alignment": default_alignment, # the default alignment applied
-            "label_template": label_template, # the template used
-            "unix_time": int(datetime.now().timestamp()),
-            "time": datetime.now().isoformat()
-        }
-        logs.append(log_entry)
-
-        with open(log_path, 'w', encoding='utf-8') as f:
-            json.dump(logs, f, indent=2)
+        # Timed as one stage of the print job: the whole log is read and
+        # rewritten for every record
+        with print_stage("log_write"), print_log_lock:
+            log_path = os.path.join(app.root_path, PRINT_LOG_FILE)
+            if os.path.exists(log_path):
+                with open(log_path, 'r', encoding='utf-8') as f:
+                    logs = json.load(f)
+            else:
+                logs = []
+
+            if entry_data is None:
+                entry_data = temp_label_store.get(session_id, {})
+            used_formdata = entry_data.get('used_formdata', {})
+            label_template = entry_data.get('label_template', {})
+            offset_adjustment = entry_data.get('offset_adjustment', (0, 0))
+            default_alignment = entry_data.get('default_alignment', (0, 0))
+
+            log_entry = {
+                "session_id": session_id,
+                "count": copies,
+                "formdata": used_formdata,        # the data used in generate_png
+                "offset_adjustment": offset_adjustment, # the offset adjustments applied
+                "default_alignment": default_alignment, # the default alignment applied
+                "label_template": label_template, # the template used
+                "unix_time": int(datetime.now().timestamp()),
+                "time": datetime.now().isoformat()
+            }
+            logs.append(log_entry)
+
+            with open(log_path, 'w', encoding='utf-8') as f:
+                json.dump(logs, f, indent=2)
     finally:
         # Always release the lock, even if an exception occurs
         release_restart_lock()
 
-def print_label_file(image_path, copies, session_id=None):
+def resolve_label_path(image_path):
+    """
+    Returns the filesystem path of a label image. Server-relative paths
+    ("/static/labels/...") are resolved against app.root_path; paths that
+    are already inside it are returned as they are.
     """
-    Prints the given image `copies` times on Windows using win32print,
-    then logs the form/template data to print-log.json.
+    if os.path.isabs(image_path) and image_path.startswith(app.root_path):
+        return image_path
+    return os.path.join(app.root_path, image_path.lstrip('/'))
+
+def print_label_file(image_path, copies, session_id=None, image=None, entry_data=None):
+    """
+    Prints the given image `copies` times on the printer this print job was
+    dispatched to, then logs the form/template data to print-log.json.
+
+    If `image` is given (e.g. from generate_device_bitmap) it is printed
+    instead of the file at image_path, and is sent without resizing when it
+    already matches the printer's resolution. Otherwise the file comes from
+    device_bitmap_cache, already converted for the printer. `entry_data` is
+    passed on to append_to_print_log.
+
+    Usually run on the print_queue worker rather than called directly.
     """
     if copies <= 0:
         return
 
-    abs_path = os.path.join(app.root_path, image_path.lstrip('/'))
-    if not os.path.exists(abs_path):
+    abs_path = resolve_label_path(image_path)
+    if image is None and not os.path.exists(abs_path):
         return
 
-    hprinter = win32print.OpenPrinter(PRINTER_NAME)
-    printer_dc = win32ui.CreateDC()
-    printer_dc.CreatePrinterDC(PRINTER_NAME)
+    printer = current_printer()
+    if image is None:
+        image = device_bitmap_cache.get(abs_path, printer.get_dpi())
+    # The backend resizes to the 5" x 1" label at its resolution if needed
+    printer.print_document(os.path.basename(abs_path), [(image, copies)])
 
-    dpi_x = printer_dc.GetDeviceCaps(88)  # HORZRES
-    dpi_y = printer_dc.GetDeviceCaps(90)  # VERTRES
+    # Log the form data & template
+    append_to_print_log(session_id if session_id else "unknown", copies, entry_data)
 
-    image = Image.open(abs_path)
-    # Example dimension: 5" x 1" label
-    target_width = int(5 * dpi_x)
-    target_height = int(1 * dpi_y)
-    image = image.resize((target_width, target_height))
+def print_existing_label_file(label_path, count, filename):
+    """
+    Print job for /print_existing_label: prints a saved label and logs it.
+    """
+    print_label_file(label_path, count)
+    append_to_print_log(f"existing_{filename}", count)
 
-    printer_dc.StartDoc(os.path.basename(abs_path))
-    for _ in range(copies):
-        printer_dc.StartPage()
-        dib = ImageWin.Dib(image)
-        dib.draw(printer_dc.GetHandleOutput(), (0, 0, target_width, target_height))
-        printer_dc.EndPage()
+def print_label_batch(labels, document_name):
+    """
+    Print job for /print_batch: prints every label, one page per copy, as a
+    single spooler document, then logs each label.
 
-    printer_dc.EndDoc()
-    printer_dc.DeleteDC()
-    win32print.ClosePrinter(hprinter)
+    Args:
+        labels (list): Dicts with "image_path", "copies" and "log_id" (the
+                       session_id written to print-log.json)
+        document_name (str): Name shown in the spooler
 
-    # Log the form data & template
-    append_to_print_log(session_id if session_id else "unknown", copies)
+    Returns:
+        The printer backend's record of the document, or None if none of
+        the label images exist any more
+    """
+    printer = current_printer()
+    pages = []
+    printed = []
+    for label in labels:
+        abs_path = resolve_label_path(label["image_path"])
+        if not os.path.exists(abs_path):
+            print(f"Warning: Skipping missing label image {abs_path}")
+            continue
+        bitmap = device_bitmap_cache.get(abs_path, printer.get_dpi())
+        pages.append((bitmap, label["copies"]))
+        printed.append(label)
+
+    if not pages:
+        return None
+    record = printer.print_document(document_name, pages)
+
+    for label in printed:
+        append_to_print_log(label["log_id"], label["copies"], {})
+    return record
+
+def split_print_batch(labels, parts):
+    """
+    Splits a /print_batch label list into up to `parts` lists with about the
+    same number of copies each, keeping the labels in order. A label's
+    copies may be split between two lists.
+    """
+    remaining = sum(label["copies"] for label in labels)
+    parts = max(1, min(parts, remaining))
+    batches = []
+    current = []
+    current_copies = 0
+    target = -(-remaining // parts)  # ceiling division
+    for label in labels:
+        copies = label["copies"]
+        while copies > 0:
+            take = min(copies, target - current_copies)
+            current.append(dict(label, copies=take))
+            current_copies += take
+            copies -= take
+            if current_copies == target and len(batches) < parts - 1:
+                batches.append(current)
+                remaining -= current_copies
+                current, current_copies = [], 0
+                target = -(-remaining // (parts - len(batches)))
+    if current:
+        batches.append(current)
+    return batches
+
+def get_session_plan(session_id):
+    """
+    Returns (plan, entry_data) for a session's stored render inputs, or
+    (None, entry_data) if /preview_label hasn't stored them.
+    """
+    entry_data = temp_label_store.get(session_id)
+    if not entry_data or "template_path" not in entry_data:
+        return None, entry_data
+    return template_registry.get_plan_for_path(entry_data["template_path"]), entry_data
+
+def render_full_png(plan, formdata, offset_adjustment, default_alignment):
+    """
+    Returns the full-resolution label as PNG bytes, from render_cache when
+    this exact label has been rendered before.
+    """
+    key = render_key(plan, formdata, offset_adjustment, default_alignment)
+    png = render_cache.get(key)
+    if png is None:
+        img = generate_png(plan, formdata, offset_adjustment, default_alignment)
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+        png = buffer.getvalue()
+        render_cache.put(key, png, persist=True)
+    return png
+
+def write_session_png(session_id, abs_path):
+    """
+    Writes the full-resolution label for a session to abs_path. The label
+    comes from the stored render inputs rather than the in-memory preview,
+    which may have been downscaled for display.
+
+    Returns:
+        True if written, False if the session has nothing to write
+    """
+    plan, entry_data = get_session_plan(session_id)
+    if plan is None:
+        return preview_store.write_file(session_id, abs_path)
+
+    png = render_full_png(
+        plan,
+        entry_data["used_formdata"],
+        entry_data["offset_adjustment"],
+        entry_data["default_alignment"]
+    )
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    with open(abs_path, 'wb') as f:
+        f.write(png)
+    return True
+
+def ensure_preview_file(session_id):
+    """
+    Makes sure static/preview_images/preview_<session_id>.png exists at full
+    resolution, writing it if needed. Previews normally live only in memory.
+
+    Returns:
+        Absolute path of the preview file, or None if there is no preview
+    """
+    preview_filename = f"preview_{session_id}.png"
+    abs_preview_path = os.path.join(app.root_path, PREVIEW_FOLDER, preview_filename)
+    if write_session_png(session_id, abs_preview_path):
+        return abs_preview_path
+    if os.path.exists(abs_preview_path):
+        return abs_preview_path
+    return None
+
+def render_session_bitmap(session_id):
+    """
+    Renders the label for a session as a 1-bit bitmap at PRINTER_DPI, using
+    the render inputs stored in temp_label_store by /preview_label.
+
+    Returns:
+        PIL Image, or None if the session has no stored render inputs
+    """
+    plan, entry_data = get_session_plan(session_id)
+    if plan is None:
+        return None
+
+    return generate_device_bitmap(
+        plan,
+        entry_data["used_formdata"],
+        entry_data["offset_adjustment"],
+        entry_data["default_alignment"],
+        dpi=PRINTER_DPI
+    )
 
 ###############################################################################
 # ROUTES
@@ -422,60 +698,147 @@ def get_templates():
     return jsonify(templates)
 
 
-@app.route('/preview_label', methods=['POST'])
-def preview_label():
+def parse_preview_request(values):
     """
-    Generate/update a single "preview" image in `static/preview_images/`
-    for the given session_id. Overwrites the same file each time.
-    Also saves 'used_formdata', 'label_template', and 'offset_adjustment' in temp_label_store.
-    """
-    session_id = request.form.get('session_id', '')
-    if not session_id:
-        return jsonify({"error": "No session_id provided"}), 400
+    Reads the render inputs for a preview from form-style values: the
+    /preview_label form, or a /preview_stream session's merged fields.
+
+    Returns:
+        dict with plan, used_formdata, offset_adjustment, default_alignment,
+        preview_width and preview_quality
 
+    Raises:
+        ValueError: If the template or preview quality is unknown, or a
+                    number can't be parsed
+    """
     # ### ADDED ### - Check if user provided a template_name
-    chosen_template_name = request.form.get('template_name', '')
+    chosen_template_name = values.get('template_name', '')
 
     if chosen_template_name:
         # If user selected a template from the dropdown
-        all_templates = load_templates()
-        if chosen_template_name not in all_templates:
-            return jsonify({"error": f"Unknown template_name: {chosen_template_name}"}), 400
-        template = all_templates[chosen_template_name]
+        plan = template_registry.get_plan(chosen_template_name)
+        if plan is None:
+            raise ValueError(f"Unknown template_name: {chosen_template_name}")
     else:
         # fallback to your default file if none provided
-        with open(label_template_path, 'r', encoding='utf-8') as f:
-            base_template = json.load(f)
-        template = {
-            "name": os.path.basename(label_template_path),
-            **base_template
-        }
+        plan = template_registry.get_plan_for_path(label_template_path)
 
     # Get offset adjustments
     offset_adjustment = (
-        int(request.form.get('x-offset', 0)),
-        int(request.form.get('y-offset', 0))
+        int(values.get('x-offset', 0) or 0),
+        int(values.get('y-offset', 0) or 0)
     )
 
     # Get default alignment adjustments
-    default_x_align = int(request.form.get('default_x_offset', 0))
-    default_y_align = int(request.form.get('default_y_offset', 0))
+    default_x_align = int(values.get('default_x_offset', 0) or 0)
+    default_y_align = int(values.get('default_y_offset', 0) or 0)
     default_alignment = (default_x_align, default_y_align)
 
+    # Preview size/quality hints; the full-resolution label is re-rendered
+    # from temp_label_store when it is saved or printed
+    preview_width = int(values.get('preview_width', 0) or 0) or None
+    preview_quality = values.get('preview_quality', 'fast')
+    if preview_quality not in PREVIEW_COMPRESS_LEVELS:
+        raise ValueError(f"Unknown preview_quality: {preview_quality}")
+
     # Identify relevant field names
-    fieldnames = [field["name"] for field in template['fields']]
-    used_formdata = {name: request.form.get(name, '') for name in fieldnames}
+    used_formdata = {name: str(values.get(name, '')) for name in plan.fieldnames}
+
+    return {
+        "plan": plan,
+        "used_formdata": used_formdata,
+        "offset_adjustment": offset_adjustment,
+        "default_alignment": default_alignment,
+        "preview_width": preview_width,
+        "preview_quality": preview_quality,
+    }
 
-    # Generate the in-memory label
-    img = generate_png(template, used_formdata, offset_adjustment, default_alignment)
+def preview_cache_key(inputs):
+    """
+    Key for an encoded preview in render_cache: the full-size render key
+    plus the preview's size and quality.
+    """
+    key = render_key(inputs["plan"], inputs["used_formdata"],
+                     inputs["offset_adjustment"], inputs["default_alignment"])
+    return f"{key}@{inputs['preview_width'] or 'full'}-{inputs['preview_quality']}"
 
-    # Construct the preview file path
-    preview_filename = f"preview_{session_id}.png"
-    abs_preview_path = os.path.join(app.root_path, PREVIEW_FOLDER, preview_filename)
-    img.save(abs_preview_path)
+def render_preview_png(session_id, request_version, plan, used_formdata,
+                       offset_adjustment, default_alignment, preview_width, preview_quality):
+    """
+    Render job run on render_executor: renders and encodes a preview PNG.
+
+    Returns:
+        PNG bytes, or None if a newer request for the session arrived while
+        this one was queued or rendering
+    """
+    if preview_store.is_superseded(session_id, request_version, stage="before_render"):
+        return None
+    img = generate_png(plan, used_formdata, offset_adjustment, default_alignment)
+    # Skip encoding if a newer request arrived while rendering
+    if preview_store.is_superseded(session_id, request_version):
+        return None
+    return encode_preview_png(img, preview_width, preview_quality)
+
+def render_session_preview(session_id, inputs, request_version=None):
+    """
+    Renders a session's preview from parse_preview_request() inputs on
+    render_executor, stores it in preview_store and temp_label_store, and
+    pushes it to any open /preview_stream connections.
+
+    If the session's current preview was rendered from the same inputs
+    (template, formdata, offset_adjustment, default_alignment, size and
+    quality), nothing is rendered or stored.
+
+    The render's queue wait and render time are left in g.render_timing for
+    the Server-Timing header (see add_server_timing).
 
-    server_relative_path = '/' + os.path.relpath(abs_preview_path, app.root_path)
-    server_relative_path = server_relative_path.replace('\\', '/')
+    Returns:
+        (slot, modified): the new PreviewSlot and True; the current slot and
+        False if the inputs are unchanged; or (None, False) if a newer
+        request for the session superseded this one
+
+    Raises:
+        RenderQueueFull: If too many renders are already waiting
+    """
+    # Latest wins: don't render a request the client has already replaced.
+    # Registering the version also stops older renders still in progress
+    # from replacing the preview after an unchanged request
+    if request_version is not None and not preview_store.begin_request(session_id, request_version):
+        return None, False
+
+    plan = inputs["plan"]
+    used_formdata = inputs["used_formdata"]
+    offset_adjustment = inputs["offset_adjustment"]
+    default_alignment = inputs["default_alignment"]
+    preview_width = inputs["preview_width"]
+    preview_quality = inputs["preview_quality"]
+    template = plan.template
+
+    # Reuse the encoded preview if this exact label was previewed before at
+    # the same size and quality; otherwise generate the in-memory label
+    preview_key = preview_cache_key(inputs)
+
+    # The session is already showing exactly this
+    current_slot = preview_store.get_unchanged(session_id, preview_key)
+    if current_slot is not None and session_id in temp_label_store:
+        return current_slot, False
+
+    png = render_cache.get(preview_key)
+    if png is None:
+        future = render_executor.submit(render_preview_png, session_id, request_version, plan,
+                                        used_formdata, offset_adjustment, default_alignment,
+                                        preview_width, preview_quality)
+        g.render_timing = future.timing
+        png = future.result()
+        if png is None:
+            return None, False
+        render_cache.put(preview_key, png)
+
+    # Store it in this session's in-memory preview slot
+    slot = preview_store.put(session_id, png, request_version, preview_key)
+    if slot is None:
+        return None, False
+    preview_filename = f"preview_{session_id}.png"
 
     # Store data for later retrieval by /print_label
     temp_label_store[session_id] = {
@@ -483,13 +846,253 @@ def preview_label():
         "label_template": template,           # the template used
         "offset_adjustment": offset_adjustment, # the offset adjustments applied
         "default_alignment": default_alignment, # ADDED: default alignment applied
+        "template_path": template["template_path"], # lets /print_label re-render at printer dpi
         "date_created": datetime.now().isoformat(),
         "preview_filename": preview_filename,
     }
 
+    preview_channel.publish(session_id, slot, request_version)
+    return slot, True
+
+@app.route('/preview_label', methods=['POST'])
+def preview_label():
+    """
+    Generate/update the single in-memory "preview" image for the given
+    session_id, served by /preview/<session_id>. Replaces the previous one each time.
+    Also saves 'used_formdata', 'label_template', and 'offset_adjustment' in temp_label_store.
+
+    Optional form fields:
+        preview_width: Downscale the preview to at most this many pixels wide
+        preview_quality: "full", "fast" (default) or "none" PNG compression
+        request_version: Increasing per-session request number. Requests
+            overtaken by a newer one are skipped and answered with
+            {"superseded": true} instead of an image_path
+
+    Answers 304 Not Modified, without rendering, if the session's current
+    preview was made from the same inputs.
+    """
+    session_id = request.form.get('session_id', '')
+    if not session_id:
+        return jsonify({"error": "No session_id provided"}), 400
+
+    try:
+        inputs = parse_preview_request(request.form)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    request_version = request.form.get('request_version', type=int)
+    try:
+        slot, modified = render_session_preview(session_id, inputs, request_version)
+    except RenderQueueFull as e:
+        return render_busy_response(e)
+    if slot is None:
+        return superseded_response(session_id, request_version)
+    if not modified:
+        return not_modified_response(slot)
+
     return jsonify({
         "message": f"Preview updated for session {session_id}.",
-        "image_path": server_relative_path
+        "image_path": f"/preview/{session_id}?v={slot.version}",
+        "version": slot.version,
+        "request_version": request_version,
+        "etag": slot.etag
+    })
+
+def superseded_response(session_id, request_version):
+    """
+    Response for a preview request replaced by a newer one from the same
+    session. Nothing was stored; the newer request's response carries the
+    image.
+    """
+    return jsonify({
+        "message": f"Preview request {request_version} superseded for session {session_id}.",
+        "superseded": True,
+        "request_version": request_version
+    })
+
+def not_modified_response(slot):
+    """
+    304 response for a preview request whose inputs match the session's
+    current preview; the client keeps showing what it has.
+    """
+    response = app.response_class(status=304)
+    response.set_etag(slot.etag)
+    response.headers['X-Preview-Version'] = str(slot.version)
+    return response
+
+@app.after_request
+def add_server_timing(response):
+    """
+    Reports how long a preview waited for a render thread and how long it
+    took to render, e.g. "Server-Timing: queue;dur=12.5, render;dur=48.1".
+    The client uses these to adapt its debounce delay and how many previews
+    it keeps in flight. Previews served from render_cache have no render
+    timing and report "cache;desc=hit" instead ("cache;desc=unchanged" for
+    304 Not Modified).
+    """
+    timing = g.get('render_timing')
+    if timing is not None and timing.render_time is not None:
+        response.headers['Server-Timing'] = (f"queue;dur={timing.queue_wait * 1000:.1f}, "
+                                             f"render;dur={timing.render_time * 1000:.1f}")
+    elif request.endpoint in ('preview_label', 'update_preview_stream'):
+        if response.status_code == 304:
+            response.headers['Server-Timing'] = 'cache;desc=unchanged'
+        elif response.status_code == 200:
+            response.headers['Server-Timing'] = 'cache;desc=hit'
+    return response
+
+def render_busy_response(error):
+    """
+    503 response for a preview that couldn't be queued because
+    render_executor is full.
+    """
+    response = jsonify({"error": str(error), "busy": True})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.route('/preview_compare', methods=['POST'])
+def preview_compare():
+    """
+    Renders the same form data under several templates at once, for
+    comparing them side by side. Renders run concurrently on
+    render_executor (previews already in render_cache aren't re-rendered),
+    and the session's own preview is left alone.
+
+    Form fields are as for /preview_label (template_name is ignored), plus:
+        template_names: A template 'label' to include; repeat the field for
+                        each template. Defaults to every template.
+
+    Returns:
+        {"previews": [{"template_name", "image" (PNG data: URI), "etag"}, ...]}
+        in the order the templates were given. A template that failed to
+        render has {"template_name", "error"} instead.
+    """
+    template_names = request.form.getlist('template_names') or list(template_registry.get_plans())
+
+    values = request.form.to_dict()
+    inputs_list = []
+    for template_name in template_names:
+        values['template_name'] = template_name
+        try:
+            inputs_list.append(parse_preview_request(values))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    # Queue every render before waiting on any of them
+    keys = [preview_cache_key(inputs) for inputs in inputs_list]
+    pngs = [render_cache.get(key) for key in keys]
+    futures = {}
+    try:
+        for index, inputs in enumerate(inputs_list):
+            if pngs[index] is None:
+                futures[index] = render_executor.submit(
+                    render_preview_png, None, None, inputs["plan"], inputs["used_formdata"],
+                    inputs["offset_adjustment"], inputs["default_alignment"],
+                    inputs["preview_width"], inputs["preview_quality"])
+    except RenderQueueFull as e:
+        for future in futures.values():
+            future.cancel()
+        return render_busy_response(e)
+
+    errors = {}
+    try:
+        for index, future in futures.items():
+            try:
+                pngs[index] = future.result()
+            except RenderQueueFull as e:
+                return render_busy_response(e)
+            except Exception as e:
+                print(f"Error rendering {template_names[index]} for comparison: {e}")
+                errors[index] = str(e)
+            else:
+                render_cache.put(keys[index], pngs[index])
+    finally:
+        # Don't leave renders nobody will collect holding executor slots
+        for future in futures.values():
+            future.cancel()
+
+    previews = []
+    for index, (template_name, png) in enumerate(zip(template_names, pngs)):
+        if index in errors:
+            previews.append({"template_name": template_name, "error": errors[index]})
+            continue
+        previews.append({
+            "template_name": template_name,
+            "image": "data:image/png;base64," + base64.b64encode(png).decode('ascii'),
+            "etag": hashlib.md5(png).hexdigest(),
+        })
+    return jsonify({"previews": previews})
+
+@app.route('/preview/<session_id>', methods=['GET'])
+def serve_preview(session_id):
+    """
+    Serves a session's current preview PNG from memory. Answers with
+    304 Not Modified when the browser already has this version (ETag).
+    """
+    slot = preview_store.get(session_id)
+    if slot is None:
+        return jsonify({"error": "No preview for this session"}), 404
+
+    response = app.response_class(slot.png, mimetype='image/png')
+    response.set_etag(slot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Preview-Version'] = str(slot.version)
+    return response.make_conditional(request)
+
+@app.route('/preview_stream/<session_id>', methods=['GET'])
+def open_preview_stream(session_id):
+    """
+    Server-Sent Events stream of a session's previews. Sends "ready" when
+    connected (the client should then send all of its fields) and a
+    "preview" event with version, request_version, etag, image_path and,
+    unless ?frames=0, the PNG itself as a data: URI in "image".
+    """
+    frames = request.args.get('frames', '1') != '0'
+    subscriber = preview_channel.subscribe(session_id, frames=frames)
+    response = Response(preview_channel.stream(session_id, subscriber),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/preview_stream/<session_id>', methods=['POST'])
+def update_preview_stream(session_id):
+    """
+    Applies a delta of changed preview fields to a session and renders it.
+    The image is pushed to the session's /preview_stream connections rather
+    than returned.
+
+    Request body (JSON):
+        fields (dict): Changed form fields, named as in /preview_label
+        request_version (int, optional): As in /preview_label
+    """
+    data = request.get_json(silent=True) or {}
+    delta = data.get('fields', {})
+    if not isinstance(delta, dict):
+        return jsonify({"error": "fields must be an object"}), 400
+    request_version = data.get('request_version')
+
+    fields = preview_channel.apply_delta(session_id, delta)
+    try:
+        inputs = parse_preview_request(fields)
+        if request_version is not None:
+            request_version = int(request_version)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        slot, modified = render_session_preview(session_id, inputs, request_version)
+    except RenderQueueFull as e:
+        return render_busy_response(e)
+    if slot is None:
+        return superseded_response(session_id, request_version)
+    if not modified:
+        return not_modified_response(slot)
+
+    return jsonify({
+        "version": slot.version,
+        "request_version": request_version,
     })
 
 @app.route('/print_label', methods=['POST'])
@@ -512,18 +1115,35 @@ def print_label():
 
     preview_filename = f"preview_{session_id}.png"
     server_relative_path = f"/{PREVIEW_FOLDER}/{preview_filename}"
-    print_label_file(server_relative_path, count, session_id=session_id)
+
+    # Render straight to a printer-resolution 1-bit bitmap rather than
+    # resizing the preview PNG; only fall back to a preview file if that
+    # isn't possible
+    device_image = render_session_bitmap(session_id)
+    if device_image is None:
+        ensure_preview_file(session_id)
+
+    # Snapshot the session now; it will have moved on to the next tag by
+    # the time a long queue reaches this job
+    entry_data = temp_label_store.get(session_id, {})
+    description = entry_data.get("used_formdata", {}).get("main_text", "") or preview_filename
+    job = print_queue.submit(print_label_file, server_relative_path, count,
+                             session_id=session_id, image=device_image, entry_data=entry_data,
+                             description=description, copies=count, media=LABEL_SIZE_INCHES)
 
     return jsonify({
-        "message": f"Printed {count} copies of preview image for session {session_id}." + 
-                  (" Label was automatically saved." if count > 1 else "")
-    })
+        "message": f"Queued {count} copies of preview image for session {session_id}." + 
+                  (" Label was automatically saved." if count > 1 else ""),
+        "job_id": job.id,
+        "status_url": f"/print_jobs/{job.id}"
+    }), 202
 
 @app.route('/save_label', methods=['POST'])
 def save_label():
     """
-    Copies the single preview file for this session from preview_images to
-    FINAL_LABELS_DIR, then appends an entry to saved-label-index.json.
+    Writes the current preview for this session (from memory, or the
+    preview_images file) to FINAL_LABELS_DIR, then appends an entry to
+    saved-label-index.json.
     Now includes main_text, midtext, and subtext in the filename.
     """
     data = request.get_json() or request.form
@@ -534,7 +1154,7 @@ def save_label():
 
     preview_filename = f"preview_{session_id}.png"
     abs_preview_path = os.path.join(app.root_path, PREVIEW_FOLDER, preview_filename)
-    if not os.path.exists(abs_preview_path):
+    if preview_store.get(session_id) is None and not os.path.exists(abs_preview_path):
         return jsonify({"error": "Preview file not found."}), 404
 
     # Retrieve stored data (form/template)
@@ -560,8 +1180,10 @@ def save_label():
 
     abs_final_path = os.path.join(app.root_path, FINAL_LABELS_DIR, final_filename)
 
-    # Copy instead of moving so we can still print the preview afterward
-    shutil.copyfile(abs_preview_path, abs_final_path)
+    # Render the full-resolution label directly; copy the file for older
+    # sessions. Either way the preview stays available for printing afterward
+    if not write_session_png(session_id, abs_final_path):
+        shutil.copyfile(abs_preview_path, abs_final_path)
 
     new_rel_path = '/' + os.path.relpath(abs_final_path, app.root_path)
     new_rel_path = new_rel_path.replace('\\', '/')
@@ -582,6 +1204,85 @@ def save_label():
         "saved_path": new_rel_path
     })
 
+@app.route('/batch_render', methods=['POST'])
+def batch_render():
+    """
+    Render many labels with one template in parallel worker processes.
+
+    Request body (JSON):
+        template_name (str): Template 'label' as listed by /get_templates
+        rows (list): One formdata dict per label
+        offset_adjustment (list, optional): [x, y] applied to every label
+        default_alignment (list, optional): [x, y] applied to every label
+        format (str, optional): "zip" (default) or "pdf" (at most
+                                batch_renderer.max_pdf_pages rows)
+
+    Returns:
+        A ZIP of PNGs plus manifest.json, or a multi-page PDF. Per-row
+        errors are listed in the manifest (and in the X-Batch-Errors header).
+    """
+    data = request.get_json() or {}
+    template_name = data.get('template_name', '')
+    rows = data.get('rows')
+    output_format = data.get('format', 'zip')
+
+    plan = template_registry.get_plan(template_name)
+    if plan is None:
+        return jsonify({"error": f"Unknown template_name: {template_name}"}), 400
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+        return jsonify({"error": "rows must be a non-empty list of formdata objects"}), 400
+    if output_format not in ('zip', 'pdf'):
+        return jsonify({"error": f"Unknown format: {output_format}"}), 400
+
+    try:
+        offset_adjustment = tuple(int(v) for v in data.get('offset_adjustment', (0, 0)))
+        default_alignment = tuple(int(v) for v in data.get('default_alignment', (0, 0)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "offset_adjustment and default_alignment must be [x, y] integers"}), 400
+
+    # Only pass the template's fields through, as /preview_label does
+    used_rows = [
+        {name: str(row.get(name, '')) for name in plan.fieldnames}
+        for row in rows
+    ]
+    template_path = plan.template["template_path"]
+
+    if output_format == 'pdf':
+        try:
+            payload, manifest = batch_renderer.render_pdf(
+                template_path, used_rows, offset_adjustment, default_alignment)
+        except BatchTooLarge as e:
+            return jsonify({"error": str(e)}), 400
+        if payload is None:
+            return jsonify({"error": "No labels could be rendered", "manifest": manifest}), 500
+        mimetype, download_name = 'application/pdf', 'labels.pdf'
+    else:
+        payload, manifest = batch_renderer.render_zip(
+            template_path, used_rows, offset_adjustment, default_alignment)
+        mimetype, download_name = 'application/zip', 'labels.zip'
+
+    response = send_file(io.BytesIO(payload), mimetype=mimetype,
+                         as_attachment=True, download_name=download_name)
+    response.headers['X-Batch-Errors'] = str(sum(1 for row in manifest if row["error"]))
+    return response
+
+@app.route('/render_stats', methods=['GET'])
+def render_stats():
+    """
+    Returns cache statistics for the label renderer and the session store.
+    """
+    return jsonify({
+        "fonts": font_registry.stats(),
+        "base_images": base_image_cache.stats(),
+        "layers": layer_cache.stats(),
+        "previews": preview_store.stats(),
+        "render_cache": render_cache.stats(),
+        "sessions": temp_label_store.stats(),
+        "preview_channel": preview_channel.stats(),
+        "render_executor": render_executor.stats(),
+        "print_bitmaps": device_bitmap_cache.stats(),
+    })
+
 # Optional route to manually download saved images
 @app.route('/download_image/<path:filename>')
 def download_image(filename):
@@ -751,6 +1452,15 @@ def restart_server():
         # Check if server is busy by attempting to acquire the lock
         if restart_lock.acquire(blocking=False):
             restart_lock.release()
+
+            # Queued print jobs would be lost, as in perform_restart()
+            if not force_restart and not print_queue.is_idle():
+                return jsonify({
+                    "success": False,
+                    "lock_text": "printing queued labels",
+                    "message": "Server is busy, print jobs pending"
+                }), 503
+
             print(f"[{datetime.now().isoformat()}] Manual restart requested by client")
             
             # Schedule restart for next tick (1 second delay)
@@ -789,12 +1499,18 @@ def print_existing_label():
     """
     Print an existing saved label by filename.
     """
-    data = request.get_json()
+    data = request.get_json() or {}
     filename = data.get('filename')
-    count = data.get('count', 1)
     
     if not filename:
         return jsonify({'error': 'No filename provided'}), 400
+
+    try:
+        count = int(data.get('count', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid count'}), 400
+    if count <= 0:
+        return jsonify({'error': 'Invalid count'}), 400
     
     # Validate filename to prevent directory traversal
     if not filename.startswith('label_') or not filename.endswith('.png'):
@@ -806,16 +1522,132 @@ def print_existing_label():
     if not os.path.exists(label_path):
         return jsonify({'error': 'Label file not found'}), 404
     
-    try:
-        # Print the existing label
-        print_label_file(label_path, count)
-        
-        # Log the print job
-        append_to_print_log(f"existing_{filename}", count)
-        
-        return jsonify({'success': True, 'message': f'Printed {count} copies of {filename}'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    # Print and log the existing label on the print queue
+    job = print_queue.submit(print_existing_label_file, label_path, count, filename,
+                             description=filename, copies=count, media=LABEL_SIZE_INCHES)
+
+    return jsonify({
+        'success': True,
+        'message': f'Queued {count} copies of {filename}',
+        'job_id': job.id,
+        'status_url': f'/print_jobs/{job.id}'
+    }), 202
+
+@app.route('/print_batch', methods=['POST'])
+def print_batch():
+    """
+    Prints many saved labels and/or tags (e.g. a day's production list) as
+    one print job and a single spooler document, one page per copy. Large
+    batches are split into one job per available printer (each share at
+    least PRINT_BATCH_SPLIT_COPIES copies), so they print in parallel.
+
+    Request body (JSON):
+    - labels: List of {"filename": "label_....png", "count": n} for saved
+              labels or {"tag_id": id, "count": n} for tags
+
+    Tag prints are recorded in the tag database when the job is queued,
+    as /api/tags/<tag_id>/print does.
+    """
+    data = request.get_json() or {}
+    items = data.get('labels')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'No labels provided'}), 400
+
+    labels = []
+    tag_prints = []
+    for index, item in enumerate(items):
+        try:
+            count = int(item.get('count', 1))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': f'Invalid label at position {index}'}), 400
+        if count <= 0:
+            return jsonify({'error': f'Invalid count for label at position {index}'}), 400
+
+        if item.get('tag_id') is not None:
+            tag = plant_tag_db.get_tag_by_id(item['tag_id'])
+            if not tag:
+                return jsonify({'error': f"Tag with ID {item['tag_id']} not found"}), 404
+            if not tag.image_path or not os.path.exists(resolve_label_path(tag.image_path)):
+                return jsonify({'error': f"No label image for tag #{tag.tag_id}"}), 404
+            labels.append({"image_path": tag.image_path, "copies": count,
+                           "log_id": f"tag_{tag.tag_id}"})
+            tag_prints.append((tag.tag_id, count))
+        else:
+            filename = item.get('filename', '')
+            # Validate filename to prevent directory traversal
+            if (not filename.startswith('label_') or not filename.endswith('.png')
+                    or '/' in filename or '\\' in filename):
+                return jsonify({'error': f'Invalid filename at position {index}'}), 400
+            label_path = os.path.join(app.root_path, 'static/labels/generated_labels', filename)
+            if not os.path.exists(label_path):
+                return jsonify({'error': f'Label file not found: {filename}'}), 404
+            labels.append({"image_path": label_path, "copies": count,
+                           "log_id": f"existing_{filename}"})
+
+    total = sum(label["copies"] for label in labels)
+    printers = print_queue.printer_count(media=LABEL_SIZE_INCHES)
+    parts = split_print_batch(labels, min(printers, total // PRINT_BATCH_SPLIT_COPIES))
+
+    # Each part goes to the least busy printer at the time it's queued
+    jobs = []
+    for number, part in enumerate(parts, start=1):
+        document_name = f"batch_{len(labels)}_labels"
+        description = f"Batch of {len(labels)} labels"
+        if len(parts) > 1:
+            document_name += f"_part{number}"
+            description += f" (part {number} of {len(parts)})"
+        jobs.append(print_queue.submit(print_label_batch, part, document_name,
+                                       description=description,
+                                       copies=sum(label["copies"] for label in part),
+                                       media=LABEL_SIZE_INCHES))
+
+    # Only once every part is queued, so a refused batch isn't recorded
+    if tag_prints:
+        if not acquire_restart_lock("adding print records to database"):
+            print("Warning: Could not acquire restart lock for print record operation")
+        try:
+            for tag_id, count in tag_prints:
+                plant_tag_db.add_print_record(tag_id, count)
+        finally:
+            release_restart_lock()
+
+    return jsonify({
+        'success': True,
+        'message': f'Queued {total} copies of {len(labels)} labels as '
+                   + ('one print job' if len(jobs) == 1 else f'{len(jobs)} print jobs'),
+        'job_id': jobs[0].id,
+        'status_url': f'/print_jobs/{jobs[0].id}',
+        'job_ids': [job.id for job in jobs],
+    }), 202
+
+@app.errorhandler(NoCompatiblePrinter)
+def no_compatible_printer(error):
+    """
+    Answers 503 when no configured printer can take a print job.
+    """
+    return jsonify({"error": str(error)}), 503
+
+@app.route('/print_jobs', methods=['GET'])
+def list_print_jobs():
+    """
+    Returns the print queue's statistics (including each printer's queue
+    and backend) and every remembered job, newest first.
+    """
+    return jsonify({
+        "stats": print_queue.stats(),
+        "jobs": print_queue.jobs(),
+    })
+
+@app.route('/print_jobs/<int:job_id>', methods=['GET'])
+def get_print_job(job_id):
+    """
+    Returns a print job's state ("queued", "printing", "done" or "failed"),
+    position (jobs ahead of it while queued), error and timings.
+    """
+    status = print_queue.status(job_id)
+    if status is None:
+        return jsonify({"error": f"Print job {job_id} not found"}), 404
+    return jsonify(status)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of rendered label images.
+
+Entries are keyed by the tag's exact hash (PlantTag.create_exact_hash: the
+formdata, template label and offset adjustment) together with the default
+alignment and the template/base image file versions, so a label anyone has
+rendered before is returned without drawing or encoding it again.
+
+Entries are held in a memory LRU with a byte budget. Entries stored with
+persist=True (full-resolution PNGs) are also written to a disk LRU with
+its own budget, so they survive the server's auto-restarts.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any
+
+from plant_tag import PlantTag
+
+# Where persisted renders are kept; outside static/ so Flask doesn't serve them
+RENDER_CACHE_DIR = 'render_cache'
+
+
+def render_key(plan, formdata, offset_adjustment, default_alignment=(0, 0)) -> str:
+    """
+    Build the cache key for a full-resolution render.
+
+    Args:
+        plan: RenderPlan used for the render
+        formdata: Dictionary of form values
+        offset_adjustment: (x, y) offset adjustment
+        default_alignment: (x, y) default alignment
+
+    Returns:
+        "<exact_hash>-<version>" where version covers the default alignment
+        and the template and base image file versions
+    """
+    tag = PlantTag(formdata=formdata, template=plan.template,
+                   offset_adjustment=list(offset_adjustment))
+    version_str = "|".join([
+        str(list(default_alignment)),
+        repr(plan.mtime),
+        repr(os.path.getmtime(plan.base_image_path)),
+    ])
+    version = hashlib.md5(version_str.encode('utf-8')).hexdigest()[:12]
+    return f"{tag.create_exact_hash()}-{version}"
+
+
+class RenderCache:
+    """
+    Two-level (memory, then disk) LRU cache of encoded images, keyed by
+    strings from render_key().
+    """
+
+    def __init__(self, cache_dir: str = RENDER_CACHE_DIR,
+                 memory_budget: int = 32 * 1024 * 1024,
+                 disk_budget: int = 256 * 1024 * 1024):
+        """
+        Initialize the RenderCache, indexing any renders already on disk.
+
+        Args:
+            cache_dir: Folder for persisted entries
+            memory_budget: Maximum bytes held in memory
+            disk_budget: Maximum bytes kept in cache_dir
+        """
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()    # key -> file size
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_disk_index()
+
+    def _path(self, key: str) -> str:
+        """File path for a persisted key."""
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _load_disk_index(self):
+        """Index existing cache files, oldest first."""
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.png'):
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _remember(self, key: str, data: bytes):
+        """Add an entry to the memory LRU and evict down to the budget."""
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _evict_disk(self):
+        """Delete the least recently used files until under the disk budget."""
+        while self._disk_bytes > self.disk_budget and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up an entry, promoting disk hits into memory.
+
+        Returns:
+            The cached bytes, or None on a miss
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+            if key in self._disk:
+                try:
+                    with open(self._path(key), 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    # File was removed behind our back
+                    self._disk_bytes -= self._disk.pop(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self._remember(key, data)
+                    self.disk_hits += 1
+                    return data
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes, persist: bool = False):
+        """
+        Store an entry.
+
+        Args:
+            key: Cache key (see render_key)
+            data: Encoded image bytes
+            persist: Also write the entry to the disk cache
+        """
+        with self._lock:
+            self._remember(key, data)
+            if not persist or key in self._disk:
+                return
+
+            # Write to a temp file first so readers never see a partial file
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: Could not write render cache file {path}: {e}")
+                return
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            self._evict_disk()
+
+    def clear(self, include_disk: bool = False):
+        """
+        Empty the memory cache and reset the counters.
+
+        Args:
+            include_disk: Also delete every persisted entry
+        """
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if include_disk:
+                for key in list(self._disk):
+                    try:
+                        os.remove(self._path(key))
+                    except OSError:
+                        pass
+                self._disk.clear()
+                self._disk_bytes = 0
+            self.memory_hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_budget": self.memory_budget,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_budget": self.disk_budget,
+            }
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Bounded executor for interactive label renders.
+
+Preview renders are handed to a fixed number of render threads instead of
+running on whichever Flask request thread received them, so a burst of
+previews can use at most max_workers threads' worth of CPU and leaves the
+rest of the server (searches, the tag manager API) responsive. At most
+max_queue jobs wait for a free thread; beyond that submit() raises
+RenderQueueFull so the caller can answer 503 instead of piling up work.
+
+Every job records how long it waited in the queue and how long it ran.
+
+```python
+executor = RenderExecutor(max_workers=2, max_queue=8)
+png = executor.run(render_fn, plan, formdata)
+```
+"""
+
+import time
+import threading
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Iterable
+
+
+class RenderQueueFull(Exception):
+    """Raised when the executor already has max_queue jobs waiting."""
+
+
+class RenderTiming:
+    """
+    Timings for one job, filled in by the render thread.
+    """
+
+    def __init__(self):
+        self.submitted = time.perf_counter()
+        self.queue_wait = None  # seconds between submit and start
+        self.render_time = None  # seconds spent running
+
+
+def summarize_timings(samples: Iterable[float]) -> Dict[str, Any]:
+    """Summarize recent timings (seconds) in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"samples": 0}
+    return {
+        "samples": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+class RenderExecutor:
+    """
+    Thread pool with a bounded queue and queue-wait/render-time metrics.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, history: int = 200):
+        """
+        Initialize the RenderExecutor.
+
+        Args:
+            max_workers: Number of render threads
+            max_queue: Jobs allowed to wait for a free thread
+            history: Number of recent jobs kept for the timing metrics
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="render")
+        self._lock = threading.Lock()
+        self._pending = 0  # queued + running
+        self._running = 0
+        self._queue_waits = deque(maxlen=history)
+        self._render_times = deque(maxlen=history)
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _run_job(self, timing: RenderTiming, fn: Callable, args, kwargs):
+        """Run one job on a render thread, recording its timings."""
+        start = time.perf_counter()
+        timing.queue_wait = start - timing.submitted
+        with self._lock:
+            self._running += 1
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            timing.render_time = time.perf_counter() - start
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+                self._queue_waits.append(timing.queue_wait)
+                self._render_times.append(timing.render_time)
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue a job.
+
+        Returns:
+            A Future for the job's result, with a .timing RenderTiming
+
+        Raises:
+            RenderQueueFull: If max_queue jobs are already waiting
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise RenderQueueFull(
+                    f"Render queue is full ({self.max_queue} jobs waiting)")
+            self._pending += 1
+            self.submitted += 1
+
+        timing = RenderTiming()
+        future = self._executor.submit(self._run_job, timing, fn, args, kwargs)
+        future.timing = timing
+        future.add_done_callback(self._release_cancelled)
+        return future
+
+    def _release_cancelled(self, future: Future):
+        """Free the queue place of a job cancelled before it started."""
+        if future.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a job on a render thread and wait for its result.
+
+        Raises:
+            RenderQueueFull: If max_queue jobs are already waiting
+        """
+        return self.submit(fn, *args, **kwargs).result()
+
+    def shutdown(self):
+        """Stop the render threads after the queued jobs finish."""
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get executor statistics."""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "queue_wait": summarize_timings(self._queue_waits),
+                "render_time": summarize_timings(self._render_times),
+            }
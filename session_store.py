@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Bounded per-session storage for the printform server.
+
+/preview_label stores each session's render inputs (formdata, template,
+offsets) so /print_label and /save_label can use them later. SessionStore
+keeps those entries with a maximum entry count and an idle TTL, so
+abandoned browser tabs don't accumulate for the life of the process. An
+on_evict callback lets the server clean up whatever else belongs to the
+session (its preview slot and preview_<session>.png file).
+
+```python
+store = SessionStore(max_entries=500, idle_ttl=2 * 60 * 60, on_evict=cleanup)
+store[session_id] = {...}
+entry = store.get(session_id)
+```
+"""
+
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Sentinel for pop() without a default
+_MISSING = object()
+
+
+def estimate_size(value: Any) -> int:
+    """
+    Approximate the memory used by a session entry in bytes, following
+    dicts, lists and tuples. Objects shared between entries (like template
+    dictionaries) are counted once per entry.
+    """
+    seen = set()
+    stack = [value]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+    return total
+
+
+class SessionStore:
+    """
+    Thread-safe map of session_id -> entry with LRU capacity eviction and
+    idle-time expiry.
+
+    Reading or writing a session marks it as used. Expired sessions are
+    removed on the next access to the store or by sweep().
+    """
+
+    def __init__(self, max_entries: int = 500, idle_ttl: float = 2 * 60 * 60,
+                 on_evict: Optional[Callable[[str, Any], None]] = None):
+        """
+        Initialize the SessionStore.
+
+        Args:
+            max_entries: Maximum number of sessions kept
+            idle_ttl: Seconds a session may go unused before it is evicted
+            on_evict: Called as on_evict(session_id, entry) for each session
+                      removed by eviction or expiry (not by pop())
+        """
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # session_id -> (entry, last_used, size), oldest first
+        self._bytes = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _drop_locked(self, session_id: str) -> Any:
+        """Remove a session and its size from the store."""
+        entry, _, size = self._entries.pop(session_id)
+        self._bytes -= size
+        return entry
+
+    def _prune_locked(self, now: float) -> List[Tuple[str, Any]]:
+        """Remove expired and excess sessions, returning what was removed."""
+        removed = []
+        while self._entries:
+            session_id, (_, last_used, _) = next(iter(self._entries.items()))
+            if now - last_used > self.idle_ttl:
+                self.expired += 1
+            elif len(self._entries) > self.max_entries:
+                self.evicted += 1
+            else:
+                break
+            removed.append((session_id, self._drop_locked(session_id)))
+        return removed
+
+    def _notify(self, removed: List[Tuple[str, Any]]):
+        """Run the eviction callback outside the lock."""
+        if self.on_evict is None:
+            return
+        for session_id, entry in removed:
+            try:
+                self.on_evict(session_id, entry)
+            except Exception as e:
+                print(f"Warning: Cleanup for session {session_id} failed: {e}")
+
+    def __setitem__(self, session_id: str, entry: Any):
+        now = time.time()
+        size = estimate_size(entry)
+        with self._lock:
+            if session_id in self._entries:
+                self._drop_locked(session_id)
+            self._entries[session_id] = (entry, now, size)
+            self._bytes += size
+            removed = self._prune_locked(now)
+        self._notify(removed)
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """Get a session's entry and mark it as used, or return default."""
+        now = time.time()
+        with self._lock:
+            removed = self._prune_locked(now)
+            item = self._entries.get(session_id)
+            if item is not None:
+                entry, _, size = item
+                self._entries[session_id] = (entry, now, size)
+                self._entries.move_to_end(session_id)
+        self._notify(removed)
+        return default if item is None else entry
+
+    def __getitem__(self, session_id: str) -> Any:
+        entry = self.get(session_id, _MISSING)
+        if entry is _MISSING:
+            raise KeyError(session_id)
+        return entry
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def pop(self, session_id: str, default: Any = _MISSING) -> Any:
+        """Remove a session without calling on_evict."""
+        with self._lock:
+            if session_id in self._entries:
+                return self._drop_locked(session_id)
+        if default is _MISSING:
+            raise KeyError(session_id)
+        return default
+
+    def sweep(self) -> int:
+        """
+        Evict expired sessions now.
+
+        Returns:
+            Number of sessions removed
+        """
+        with self._lock:
+            removed = self._prune_locked(time.time())
+        self._notify(removed)
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get store statistics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "idle_ttl": self.idle_ttl,
+                "entry_bytes": self._bytes,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
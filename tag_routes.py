@@ -13,9 +13,36 @@ register_tag_routes(app)
 
 from flask import jsonify, request, render_template, send_from_directory
 import os
+import sys
 import sqlite3
 from datetime import datetime
 from plant_tag import PlantTag, PlantTagDatabase, handle_print_request
+from print_jobs import print_queue
+from label_renderer import LABEL_SIZE_INCHES
+
+_printform_server = None
+
+def load_printform_server():
+    """
+    Get the printform server module, for its restart lock and printer.
+
+    When the server was started as a script it is __main__, and that module
+    is used so prints share its printer backend. Otherwise
+    printform-server.py is loaded once and reused.
+    """
+    global _printform_server
+    if _printform_server is None:
+        main = sys.modules.get('__main__')
+        if main is not None and hasattr(main, 'print_label_file'):
+            _printform_server = main
+        else:
+            import importlib.util
+            spec = importlib.util.spec_from_file_location("printform_server", 
+                                                         os.path.join(os.getcwd(), "printform-server.py"))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _printform_server = module
+    return _printform_server
 
 def register_tag_routes(app):
     """
@@ -122,7 +149,9 @@ def register_tag_routes(app):
     @app.route('/api/tags/<int:tag_id>/print', methods=['POST'])
     def print_tag(tag_id):
         """
-        Print a specific tag.
+        Print a specific tag. The print record is added right away and the
+        print itself is queued on print_queue; poll /print_jobs/<job_id> to
+        follow it.
         
         Request body:
         - copies: Number of copies to print
@@ -143,11 +172,7 @@ def register_tag_routes(app):
             # Add print record (this is a critical operation that needs lock protection)
             # Import the restart lock from the main server
             try:
-                import importlib.util
-                spec = importlib.util.spec_from_file_location("printform_server", 
-                                                             os.path.join(os.getcwd(), "printform-server.py"))
-                printform_server = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(printform_server)
+                printform_server = load_printform_server()
                 
                 # Acquire restart lock to prevent restart during database write
                 # This ensures the database operation completes before any restart
@@ -167,7 +192,8 @@ def register_tag_routes(app):
             # Get updated tag
             tag = db.get_tag_by_id(tag_id)
             
-            # Perform the actual printing
+            # Queue the actual printing
+            job = None
             if tag.image_path:
                 try:
                     # Now use the print_label_file function
@@ -175,8 +201,11 @@ def register_tag_routes(app):
                     abs_path = os.path.join(os.getcwd(), tag.image_path.lstrip('/'))
                     
                     if os.path.exists(abs_path):
-                        printform_server.print_label_file(tag.image_path, copies)
-                        message = f"Printed {copies} copies of tag #{tag_id}"
+                        job = print_queue.submit(printform_server.print_label_file,
+                                                 tag.image_path, copies,
+                                                 description=f"Tag #{tag_id}", copies=copies,
+                                                 media=LABEL_SIZE_INCHES)
+                        message = f"Queued {copies} copies of tag #{tag_id}"
                     else:
                         message = f"Warning: Image file not found at {abs_path}. Tag #{tag_id} recorded as printed {copies} times, but no physical print was made."
                 except Exception as e:
@@ -187,7 +216,9 @@ def register_tag_routes(app):
             return jsonify({
                 "message": message,
                 "tag": tag.to_dict(),
-                "total_prints": tag.get_total_prints()
+                "total_prints": tag.get_total_prints(),
+                "job_id": job.id if job else None,
+                "status_url": f"/print_jobs/{job.id}" if job else None
             })
         except ImportError as e:
             return jsonify({"error": f"Error importing print_label_file function: {str(e)}"}), 500
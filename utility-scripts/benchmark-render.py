@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark the label rendering pipeline.
+
+Times template loading, generate_png, generate_device_bitmap, offset_image
+and the full /preview_label request (through Flask's test client) for every
+shipped template, with short and very long field text, against cold caches
+(every font, base image, layer and render cache emptied first) and warm
+caches. Results are written as JSON so runs can be compared:
+
+    python utility-scripts/benchmark-render.py --output before.json
+    python utility-scripts/benchmark-render.py --output after.json --compare before.json
+
+The /preview_label cases import printform-server.py, which needs a
+configured printer backend: the default on Windows is gdi (pywin32), so
+set PRINTFORM_PRINTER_BACKEND=null to run them without a printer. They are
+skipped with a note when the server can't be loaded.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import importlib.util
+from datetime import datetime
+
+# Run from the repository root, where the server's relative paths resolve
+START_DIR = os.getcwd()
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import PIL
+from label_renderer import (TemplateRegistry, generate_png, generate_device_bitmap,
+                            offset_image, clear_caches)
+
+# Field text for each text case; fields not listed get the main text
+TEXT_CASES = {
+    "short": {
+        "main_text": "Acer palmatum",
+        "midtext": "Bloodgood",
+        "subtext": "Japanese Maple",
+    },
+    "long": {
+        "main_text": "Chamaecyparis pisifera 'Filifera Aurea Nana' x obtusa hybrid selection",
+        "midtext": "Extraordinarily long cultivar name for a dwarf golden threadleaf form",
+        "subtext": "Full sun to part shade, moist well-drained acidic soil, zones 4 to 8, slow growing",
+    },
+}
+
+OFFSET_ADJUSTMENT = (12, -8)
+DEFAULT_ALIGNMENT = (0, 0)
+PREVIEW_WIDTH = 1600
+
+
+def formdata_for(plan, text_case, variant=""):
+    """Build formdata for every field of a plan from a text case."""
+    texts = TEXT_CASES[text_case]
+    return {
+        name: texts.get(name, texts["main_text"]) + variant
+        for name in plan.fieldnames
+    }
+
+
+def summarize(samples):
+    """Summarize timing samples (seconds) in milliseconds."""
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "iterations": len(samples),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p95_ms": round(ordered[p95_index] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def measure(fn, iterations, setup=None):
+    """
+    Time fn() over a number of iterations, calling setup() untimed before
+    each one. Returns the summary dictionary.
+    """
+    samples = []
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_template_loading(results, iterations):
+    """Time listing and compiling every template."""
+    results.append({
+        "name": "template_loading", "template": None, "text": None, "cache": "cold",
+        **measure(lambda i: TemplateRegistry().get_plans(), iterations),
+    })
+
+    registry = TemplateRegistry()
+    registry.get_plans()
+    results.append({
+        "name": "template_loading", "template": None, "text": None, "cache": "warm",
+        **measure(lambda i: registry.get_plans(), iterations),
+    })
+
+
+def bench_renderer(results, plans, iterations):
+    """Time generate_png, generate_device_bitmap and offset_image."""
+    for label, plan in plans.items():
+        for text_case in TEXT_CASES:
+            formdata = formdata_for(plan, text_case)
+
+            for name, render in (("generate_png", generate_png),
+                                 ("generate_device_bitmap", generate_device_bitmap)):
+                def run(i, render=render):
+                    render(plan, formdata, OFFSET_ADJUSTMENT, DEFAULT_ALIGNMENT)
+
+                results.append({
+                    "name": name, "template": label, "text": text_case, "cache": "cold",
+                    **measure(run, iterations, setup=clear_caches),
+                })
+                run(0)
+                results.append({
+                    "name": name, "template": label, "text": text_case, "cache": "warm",
+                    **measure(run, iterations),
+                })
+
+            img = generate_png(plan, formdata, (0, 0), DEFAULT_ALIGNMENT)
+            results.append({
+                "name": "offset_image", "template": label, "text": text_case, "cache": None,
+                **measure(lambda i: offset_image(img, *OFFSET_ADJUSTMENT), iterations),
+            })
+
+
+def load_server():
+    """Import printform-server.py, or return None if it can't be imported here."""
+    spec = importlib.util.spec_from_file_location(
+        "printform_server", os.path.join(REPO_DIR, "printform-server.py"))
+    server = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(server)
+    except (ImportError, RuntimeError) as e:
+        # RuntimeError: the configured printer backend can't be used here
+        print(f"Skipping /preview_label benchmarks: {e}")
+        return None
+    return server
+
+
+def bench_preview_route(results, server, plans, iterations):
+    """
+    Time the whole /preview_label request:
+        cold:      every cache emptied and the template registry recreated
+        keystroke: caches warm but the text differs each time, as when typing
+        warm:      the exact same request again (answered with 304 Not Modified,
+                   since the session's preview already shows those inputs)
+    """
+    client = server.app.test_client()
+
+    def reset():
+        clear_caches()
+        server.render_cache.clear()
+        server.preview_store.remove("benchmark")
+        server.template_registry = TemplateRegistry()
+
+    for label, plan in plans.items():
+        for text_case in TEXT_CASES:
+            def post(i, variant=""):
+                data = {
+                    "session_id": "benchmark",
+                    "template_name": label,
+                    "x-offset": OFFSET_ADJUSTMENT[0],
+                    "y-offset": OFFSET_ADJUSTMENT[1],
+                    "preview_width": PREVIEW_WIDTH,
+                    "preview_quality": "fast",
+                    **formdata_for(plan, text_case, variant),
+                }
+                response = client.post('/preview_label', data=data)
+                if response.status_code == 304:
+                    return
+                if response.status_code != 200:
+                    raise RuntimeError(f"/preview_label returned {response.status_code}: "
+                                       f"{response.get_data(as_text=True)}")
+                client.get(response.get_json()["image_path"])
+
+            results.append({
+                "name": "preview_label", "template": label, "text": text_case, "cache": "cold",
+                **measure(post, iterations, setup=reset),
+            })
+            post(0)
+            results.append({
+                "name": "preview_label", "template": label, "text": text_case, "cache": "keystroke",
+                **measure(lambda i: post(i, variant=f" {i}"), iterations),
+            })
+            results.append({
+                "name": "preview_label", "template": label, "text": text_case, "cache": "warm",
+                **measure(post, iterations),
+            })
+
+    server.preview_store.remove("benchmark")
+    server.temp_label_store.pop("benchmark", None)
+
+
+def git_revision():
+    """Current commit, or None outside a git checkout."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(case):
+    """Identify a case across runs."""
+    return (case["name"], case["template"], case["text"], case["cache"])
+
+
+def print_comparison(results, baseline_path):
+    """Print median changes against an earlier results file."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {case_key(case): case for case in json.load(f)["results"]}
+
+    print(f"\nMedian vs {baseline_path}:")
+    for case in results:
+        before = baseline.get(case_key(case))
+        if before is None:
+            continue
+        change = (case["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 \
+            if before["median_ms"] else 0.0
+        name = " / ".join(str(part) for part in case_key(case) if part is not None)
+        print(f"  {name:<70} {before['median_ms']:>9.2f} -> {case['median_ms']:>9.2f} ms "
+              f"({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark label rendering and previews.")
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="Timed iterations per case (default: 20)")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Earlier results file to compare medians against")
+    parser.add_argument("--skip-server", action="store_true",
+                        help="Don't benchmark the /preview_label route")
+    args = parser.parse_args()
+    # Output paths are relative to where the script was started from
+    output_path = os.path.join(START_DIR, args.output) if args.output else None
+    compare_path = os.path.join(START_DIR, args.compare) if args.compare else None
+
+    plans = TemplateRegistry().get_plans()
+    results = []
+
+    bench_template_loading(results, args.iterations)
+    bench_renderer(results, plans, args.iterations)
+
+    server = None if args.skip_server else load_server()
+    if server is not None:
+        bench_preview_route(results, server, plans, args.iterations)
+        server.batch_renderer.shutdown()
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+        "templates": sorted(plans),
+        "results": results,
+    }
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {output_path}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if compare_path:
+        print_comparison(results, compare_path)
+
+
+if __name__ == '__main__':
+    main()